@@ -0,0 +1,196 @@
+import asyncio
+import math
+from collections import deque
+
+from aiorf.exceptions import ServiceUnavailable
+from aiorf.metrics import timed
+
+
+class PoolCapacity:
+    """
+    The connections of one pool, split between endpoints.
+
+    `Limiter`s sharing a capacity hold `reserve` connections each for
+    their own requests; the rest of `size` is shared, so a slow endpoint
+    can fill the shared part but never the reservations of the others.
+    `size` should be the pool's maximum size.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.reserved = 0
+        self.shared_in_use = 0
+        self.limiters = []
+
+    @property
+    def shared(self):
+        return self.size - self.reserved
+
+    def add(self, limiter):
+        if self.reserved + limiter.reserve > self.size:
+            raise ValueError('Reservations exceed the pool size of {}'.format(self.size))
+        self.reserved += limiter.reserve
+        self.limiters.append(limiter)
+
+    def take(self):
+        if self.shared_in_use >= self.shared:
+            return False
+        self.shared_in_use += 1
+        return True
+
+    def release(self):
+        self.shared_in_use -= 1
+        for limiter in self.limiters:
+            limiter.wake()
+
+
+class Limiter:
+    """
+    At most `limit` requests at a time, `queue_size` more waiting in
+    order for up to `timeout` seconds. Requests past the queue or the
+    deadline fail right away with 503, so an overloaded process sheds load
+    instead of piling up requests on the pool.
+
+    With a `capacity`, requests past the `reserve` also need a shared
+    connection of it.
+    """
+    def __init__(self, limit=None, queue_size=0, timeout=None, capacity=None, reserve=0):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.capacity = capacity
+        self.reserve = reserve
+        self.active = 0
+        self.rejected = 0
+        self.waiters = deque()
+        if capacity is not None:
+            capacity.add(self)
+
+    def try_take(self):
+        if self.limit is not None and self.active >= self.limit:
+            return False
+        # Requests past the reservation run on shared connections
+        if self.capacity is not None and self.active >= self.reserve and not self.capacity.take():
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        if self.capacity is not None and self.active >= self.reserve:
+            self.capacity.release()
+        else:
+            self.wake()
+
+    def wake(self):
+        while self.waiters:
+            waiter = self.waiters[0]
+            if waiter.done():
+                self.waiters.popleft()
+            elif self.try_take():
+                self.waiters.popleft()
+                waiter.set_result(None)
+            else:
+                break
+
+    async def acquire(self, deadline=None):
+        """
+        Wait for a slot until `deadline`, a loop time, or `timeout` from
+        now. Raises `ServiceUnavailable` when there's none.
+        """
+        if not self.waiters and self.try_take():
+            return
+        if len(self.waiters) >= self.queue_size:
+            self.reject()
+        loop = asyncio.get_event_loop()
+        if self.timeout is not None:
+            own_deadline = loop.time() + self.timeout
+            deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+        waiter = loop.create_future()
+        self.waiters.append(waiter)
+        timeout = None if deadline is None else max(deadline - loop.time(), 0)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            # The slot may have come with the deadline
+            if not waiter.done():
+                self.forget(waiter)
+                self.reject()
+        except BaseException:
+            if waiter.done():
+                self.release()
+            else:
+                self.forget(waiter)
+            raise
+
+    def forget(self, waiter):
+        """
+        Give up waiting. Waiters leave the queue right away, so it only
+        holds pending ones and they alone count against `queue_size`.
+        """
+        self.waiters.remove(waiter)
+        waiter.cancel()
+
+    def reject(self):
+        self.rejected += 1
+        retry_after = max(1, math.ceil(self.timeout or 1))
+        raise ServiceUnavailable('Too many requests in progress', retry_after=retry_after)
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'waiting': sum(1 for waiter in self.waiters if not waiter.done()),
+            'rejected': self.rejected,
+        }
+
+
+class Admission:
+    """
+    Admission control of an endpoint: a `Limiter` for all its requests,
+    and one per method in `methods`, e.g. `{'POST': Limiter(4)}`.
+    Requests wait for their method's slot, then the endpoint's, within one
+    deadline of the endpoint's `timeout`.
+    """
+    def __init__(self, limiter=None, methods=None):
+        self.limiter = limiter
+        self.methods = {method.upper(): limiter for method, limiter in (methods or {}).items()}
+
+    def get_limiters(self, method):
+        limiters = []
+        if method in self.methods:
+            limiters.append(self.methods[method])
+        if self.limiter is not None:
+            limiters.append(self.limiter)
+        return limiters
+
+    def admit(self, method):
+        return _Admitted(self.get_limiters(method), self.limiter and self.limiter.timeout)
+
+    def stats(self):
+        stats = {'*': self.limiter.stats()} if self.limiter is not None else {}
+        stats.update((method, limiter.stats()) for method, limiter in self.methods.items())
+        return stats
+
+
+class _Admitted:
+    def __init__(self, limiters, timeout):
+        self.limiters = limiters
+        self.timeout = timeout
+        self.taken = []
+
+    async def __aenter__(self):
+        deadline = None
+        if self.timeout is not None:
+            deadline = asyncio.get_event_loop().time() + self.timeout
+        try:
+            with timed('queue'):
+                for limiter in self.limiters:
+                    await limiter.acquire(deadline)
+                    self.taken.append(limiter)
+        except BaseException:
+            await self.__aexit__()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        while self.taken:
+            self.taken.pop().release()
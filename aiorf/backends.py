@@ -0,0 +1,332 @@
+import datetime
+import decimal
+import json
+import uuid
+import weakref
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from sqlalchemy.sql import ClauseElement
+
+from aiorf.exceptions import BadRequest
+from aiorf.metrics import timed
+from aiorf.statements import Statement
+from aiorf.streaming import CSV, NDJSON, format_rows
+
+
+class Backend:
+    """
+    Database access used by `Endpoint`.
+
+    `acquire()` is an async context manager giving a connection with
+    `execute` (returns the affected row count), `fetch`, `fetchrow`,
+    `fetchval`, `transaction`, `cursor`, `explain`, `copy_query` and
+    `copy_records`. Queries are SQLAlchemy expressions, `Statement`s or
+    plain SQL without parameters. Rows support `row['column']`, which is
+    what the schemas read.
+    """
+    dialect = None
+
+    def __init__(self, pool):
+        self.pool = pool
+        # Connections handed out and acquires waiting, for the pool gauges
+        self.in_use = 0
+        self.waiting = 0
+
+    def acquire(self):
+        raise NotImplementedError
+
+    def get_pools(self):
+        """
+        `(role, backend)` of the pools behind this backend.
+        """
+        return [('primary', self)]
+
+
+class _Acquire:
+    def __init__(self, backend, connection_class):
+        self.backend = backend
+        self.connection_class = connection_class
+        self._context = None
+
+    async def __aenter__(self):
+        backend = self.backend
+        backend.waiting += 1
+        try:
+            with timed('acquire'):
+                self._context = backend.pool.acquire()
+                conn = await self._context.__aenter__()
+        finally:
+            backend.waiting -= 1
+        backend.in_use += 1
+        return self.connection_class(backend, conn)
+
+    async def __aexit__(self, *exc_info):
+        self.backend.in_use -= 1
+        return await self._context.__aexit__(*exc_info)
+
+
+# NDJSON is `row_to_json` written as CSV with a quote and delimiter that
+# never occur in its output, which unlike the text format leaves
+# backslashes alone
+_copy_options = {
+    CSV: {'format': 'csv', 'header': True},
+    NDJSON: {'format': 'csv', 'quote': '\x01', 'delimiter': '\x02'},
+}
+
+
+def get_copy_sql(sql, fmt):
+    if fmt == NDJSON:
+        return 'SELECT row_to_json(aiorf_row) FROM ({}) AS aiorf_row'.format(sql)
+    return sql
+
+
+# Names of the statements prepared on each psycopg2 connection
+_prepared = weakref.WeakKeyDictionary()
+
+
+class AiopgConnection:
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self.conn = conn
+
+    async def _execute(self, query, params=None):
+        if isinstance(query, Statement):
+            return await self._execute_statement(query, params or {})
+        if params:
+            return await self.conn.execute(query, params)
+        return await self.conn.execute(query)
+
+    async def _execute_statement(self, statement, params):
+        values = statement.get_params(params)
+        if not statement.prepare:
+            return await self.conn.execute(statement.sql, values)
+        # Names come from the SQL, any `Statement` of it can use a prepared one
+        prepared = _prepared.setdefault(self.conn.connection, set())
+        if statement.name not in prepared:
+            await self.conn.execute('PREPARE {} AS {}'.format(statement.name, statement.numbered_sql))
+            prepared.add(statement.name)
+        if not statement.param_names:
+            return await self.conn.execute('EXECUTE {}'.format(statement.name))
+        placeholders = ', '.join('%({})s'.format(name) for name in statement.param_names)
+        return await self.conn.execute('EXECUTE {} ({})'.format(statement.name, placeholders), values)
+
+    async def execute(self, query, params=None):
+        with timed('db'):
+            result = await self._execute(query, params)
+        return result.rowcount
+
+    async def fetch(self, query, params=None):
+        with timed('db'):
+            result = await self._execute(query, params)
+            return await result.fetchall()
+
+    async def fetchrow(self, query, params=None):
+        with timed('db'):
+            result = await self._execute(query, params)
+            return await result.first()
+
+    async def fetchval(self, query, params=None):
+        with timed('db'):
+            result = await self._execute(query, params)
+            return await result.scalar()
+
+    def transaction(self):
+        return self.conn.begin()
+
+    async def cursor(self, query, batch_size):
+        """
+        Yield lists of rows read from a server-side cursor.
+
+        psycopg2 has no named cursors in async mode, so the cursor is
+        declared in SQL and lives in a transaction that ends with the
+        iteration.
+        """
+        name = 'aiorf_{}'.format(uuid.uuid4().hex)
+        compiled = query.compile(dialect=self.backend.dialect)
+        async with self.conn.begin():
+            await self.conn.execute(
+                'DECLARE {} NO SCROLL CURSOR FOR {}'.format(name, compiled),
+                compiled.params)
+            while True:
+                result = await self.conn.execute('FETCH FORWARD {} FROM {}'.format(batch_size, name))
+                rows = await result.fetchall()
+                if not rows:
+                    break
+                yield rows
+                if len(rows) < batch_size:
+                    break
+
+    async def explain(self, query):
+        compiled = query.compile(dialect=self.backend.dialect)
+        result = await self.conn.execute('EXPLAIN (FORMAT JSON) {}'.format(compiled), compiled.params)
+        return await result.scalar()
+
+    async def copy_query(self, query, output, fmt=CSV):
+        """
+        Pass the rows of `query` as CSV or NDJSON to `output`, an async
+        callable taking bytes. psycopg2 can't `COPY` in async mode, so
+        the rows are read from a cursor and formatted here.
+        """
+        header = fmt == CSV
+        async for rows in self.cursor(query, 1000):
+            await output(format_rows(rows, fmt, header))
+            header = False
+
+    async def copy_records(self, table_name, columns, records):
+        """
+        Write tuples of `columns` to a table. psycopg2 can't `COPY` in
+        async mode, so this is a multi-row `INSERT`.
+        """
+        table = sa.table(table_name, *[sa.column(name) for name in columns])
+        with timed('db'):
+            await self.conn.execute(table.insert().values([dict(zip(columns, record)) for record in records]))
+
+
+class AiopgBackend(Backend):
+    """
+    aiopg `sa` engine, the original backend of `Endpoint`.
+    """
+    @property
+    def dialect(self):
+        return self.pool.dialect
+
+    def acquire(self):
+        return _Acquire(self, AiopgConnection)
+
+
+def parse_bool(value):
+    if value.lower() in ('true', 't', '1', 'yes', 'on'):
+        return True
+    if value.lower() in ('false', 'f', '0', 'no', 'off'):
+        return False
+    raise ValueError(value)
+
+
+_parsers = {
+    int: int,
+    float: float,
+    decimal.Decimal: decimal.Decimal,
+    bool: parse_bool,
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    uuid.UUID: uuid.UUID,
+}
+
+
+def coerce_param(type_, value):
+    """
+    asyncpg binds parameters in binary and won't cast strings the way
+    Postgres casts the literals psycopg2 sends, so strings coming from URLs
+    are parsed into the python type of their column first.
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        parser = _parsers.get(type_.python_type)
+    except NotImplementedError:
+        return value
+    if parser is None:
+        return value
+    try:
+        return parser(value)
+    except ValueError:
+        raise BadRequest('Invalid value {!r}'.format(value))
+
+
+class AsyncpgConnection:
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self.conn = conn
+
+    def _prepare(self, query, params):
+        if isinstance(query, ClauseElement):
+            query = Statement(query, self.backend.dialect)
+        if isinstance(query, Statement):
+            return query.numbered_sql, query.get_args(params or {}, coerce_param)
+        return query, []
+
+    async def execute(self, query, params=None):
+        sql, args = self._prepare(query, params)
+        with timed('db'):
+            status = await self.conn.execute(sql, *args)
+        # Command tags look like 'UPDATE 5' or 'INSERT 0 5'
+        count = status.rsplit(' ', 1)[-1]
+        return int(count) if count.isdigit() else 0
+
+    async def fetch(self, query, params=None):
+        sql, args = self._prepare(query, params)
+        with timed('db'):
+            return await self.conn.fetch(sql, *args)
+
+    async def fetchrow(self, query, params=None):
+        sql, args = self._prepare(query, params)
+        with timed('db'):
+            return await self.conn.fetchrow(sql, *args)
+
+    async def fetchval(self, query, params=None):
+        sql, args = self._prepare(query, params)
+        with timed('db'):
+            return await self.conn.fetchval(sql, *args)
+
+    def transaction(self):
+        return self.conn.transaction()
+
+    async def cursor(self, query, batch_size):
+        """
+        Yield lists of rows read from an asyncpg server-side cursor.
+        """
+        sql, args = self._prepare(query, None)
+        async with self.conn.transaction():
+            cursor = await self.conn.cursor(sql, *args)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield rows
+                if len(rows) < batch_size:
+                    break
+
+    async def explain(self, query):
+        sql, args = self._prepare(query, None)
+        return json.loads(await self.conn.fetchval('EXPLAIN (FORMAT JSON) {}'.format(sql), *args))
+
+    async def copy_query(self, query, output, fmt=CSV):
+        """
+        Pass the rows of `query` as CSV or NDJSON to `output`, an async
+        callable taking bytes, as Postgres writes them with `COPY (...) TO
+        STDOUT`. No rows are built in python.
+        """
+        sql, args = self._prepare(query, None)
+        with timed('db'):
+            await self.conn.copy_from_query(get_copy_sql(sql, fmt), *args, output=output, **_copy_options[fmt])
+
+    async def copy_records(self, table_name, columns, records):
+        """
+        Write tuples of `columns` to a table with binary `COPY ... FROM STDIN`.
+        """
+        with timed('db'):
+            await self.conn.copy_records_to_table(table_name, records=records, columns=columns)
+
+
+class AsyncpgBackend(Backend):
+    """
+    asyncpg pool. Rows are decoded with the binary protocol and statements
+    are prepared and cached per connection by asyncpg itself.
+    """
+    dialect = PGDialect_psycopg2()
+
+    def acquire(self):
+        return _Acquire(self, AsyncpgConnection)
+
+
+def get_backend(pool):
+    """
+    Wrap a pool into the backend matching its driver.
+    """
+    if isinstance(pool, Backend):
+        return pool
+    if type(pool).__module__.startswith('asyncpg'):
+        return AsyncpgBackend(pool)
+    return AiopgBackend(pool)
@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class BaseCache:
+    """
+    Interface of object cache backends.
+
+    Methods are coroutines so that backends can live out of process;
+    `get` returns `MISSING` when there is no entry.
+    """
+    async def get(self, key):
+        raise NotImplementedError
+
+    async def set(self, key, value):
+        raise NotImplementedError
+
+    async def delete(self, key):
+        raise NotImplementedError
+
+    async def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(BaseCache):
+    """
+    In-process backend keeping up to `maxsize` entries for `ttl` seconds.
+    """
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ObjectCache:
+    """
+    Read-through cache of single objects keyed by model and lookup value.
+
+    Every model has a generation number that is part of its keys, bumping
+    it drops all cached objects of the model at once, which is what bulk
+    writes need. Generations live in the process, with a shared backend
+    other workers only see bulk writes once their entries expire. Hits and
+    misses are counted here so that every backend reports them.
+
+    A load running while its key is invalidated may have read the old
+    object, so its result is returned but not cached.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LRUCache()
+        self.hits = 0
+        self.misses = 0
+        self._generations = {}
+        # key -> token of the latest load, dropped by `invalidate`
+        self._loading = {}
+
+    def get_key(self, model, value):
+        name = getattr(model, '__tablename__', None) or model.__name__
+        return '{}:{}:{}'.format(name, self._generations.get(model, 0), value)
+
+    async def get_or_load(self, model, value, load):
+        """
+        Return the cached object or await `load()` and cache its result.
+        """
+        key = self.get_key(model, value)
+        obj = await self.backend.get(key)
+        if obj is not MISSING:
+            self.hits += 1
+            return obj
+        self.misses += 1
+        token = self._loading[key] = object()
+        try:
+            obj = await load()
+        finally:
+            current = self._loading.get(key) is token
+            if current:
+                del self._loading[key]
+        if current:
+            await self.backend.set(key, obj)
+        return obj
+
+    async def invalidate(self, model, value):
+        key = self.get_key(model, value)
+        self._loading.pop(key, None)
+        await self.backend.delete(key)
+
+    def invalidate_model(self, model):
+        self._generations[model] = self._generations.get(model, 0) + 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,49 @@
+import asyncio
+
+from aiohttp import web
+
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers with the same key.
+
+    The call runs in its own task, so a caller that goes away (a client
+    disconnecting) doesn't cancel the work the others are waiting for.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def do(self, key, func):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+        }
+
+
+def copy_response(response):
+    """
+    A fresh response with the status, headers and body of a shared one.
+    """
+    return web.Response(status=response.status, reason=response.reason,
+                        body=response.body, headers=response.headers)
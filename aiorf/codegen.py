@@ -0,0 +1,108 @@
+import datetime
+
+from marshmallow import Schema, fields, missing
+
+LOOKUP_ERRORS = (KeyError, IndexError, TypeError, AttributeError)
+
+
+def _convert(field, value, index, name):
+    """
+    Expression converting `value` the way `field._serialize` would, or a
+    call to `field._serialize` when the field type is not inlined.
+    """
+    fallback = 'f{}._serialize({}, {!r}, obj)'.format(index, value, name)
+    kind = type(field)
+    if kind in (fields.Integer, fields.Float) and not field.as_string:
+        return 'None if {v} is None else {t}({v})'.format(v=value, t=kind.num_type.__name__)
+    if kind is fields.String:
+        return '{v} if {v} is None or {v}.__class__ is str else {f}'.format(v=value, f=fallback)
+    if kind is fields.Boolean:
+        return '{v} if {v} is None or {v} is True or {v} is False else {f}'.format(v=value, f=fallback)
+    if kind is fields.DateTime and (field.format or 'iso') in ('iso', 'iso8601'):
+        return 'None if {v} is None else {v}.isoformat()'.format(v=value)
+    if kind is fields.Date and (field.format or 'iso') in ('iso', 'iso8601'):
+        return 'None if {v} is None else date_isoformat({v})'.format(v=value)
+    return 'None if {v} is None else {f}'.format(v=value, f=fallback)
+
+
+def compile_dump(schema_class, names=None):
+    """
+    Generate a function dumping a list of rows for `schema_class`, or for
+    the fields in `names` only.
+
+    The function takes `(objs, fields, get)`, the bound `dump_fields` and
+    the `get_attribute` of a schema instance, and returns the same dicts
+    as `Schema._serialize(objs, many=True)`. Values are looked up and
+    converted inline; anything unusual (missing keys, defaults, custom
+    field types) goes through the field's own methods. Returns `None`
+    when the schema can't be compiled.
+    """
+    if schema_class.get_attribute is not Schema.get_attribute or schema_class.opts.ordered:
+        return None
+
+    dump_fields = [(name, field) for name, field in schema_class._declared_fields.items()
+                   if not field.load_only and (names is None or name in names)]
+    lines = ['def dump_many(objs, fields, get):']
+    for index, (name, field) in enumerate(dump_fields):
+        lines.append('    f{} = fields[{!r}]'.format(index, name))
+    lines.extend([
+        '    ret = []',
+        '    append = ret.append',
+        '    for obj in objs:',
+        '        mapping = hasattr(obj, "__getitem__")',
+        '        d = {}',
+    ])
+    for index, (name, field) in enumerate(dump_fields):
+        key = field.data_key if field.data_key is not None else name
+        attribute = field.attribute if field.attribute is not None else name
+        if not field._CHECK_ATTRIBUTE or '.' in attribute:
+            lines.extend([
+                '        v = f{}.serialize({!r}, obj, get)'.format(index, name),
+                '        if v is not missing:',
+                '            d[{!r}] = v'.format(key),
+            ])
+            continue
+        lines.extend([
+            '        try:',
+            '            v = obj[{a!r}] if mapping else getattr(obj, {a!r})'.format(a=attribute),
+            '        except LOOKUP_ERRORS:',
+            '            v = f{}.serialize({!r}, obj, get)'.format(index, name),
+            '            if v is not missing:',
+            '                d[{!r}] = v'.format(key),
+            '        else:',
+            '            d[{!r}] = {}'.format(key, _convert(field, 'v', index, name)),
+        ])
+    lines.extend([
+        '        append(d)',
+        '    return ret',
+    ])
+
+    namespace = {
+        'missing': missing,
+        'LOOKUP_ERRORS': LOOKUP_ERRORS,
+        'date_isoformat': datetime.date.isoformat,
+    }
+    source = '\n'.join(lines)
+    exec(compile(source, '<aiorf dump {}>'.format(schema_class.__name__), 'exec'), namespace)
+    dump_many = namespace['dump_many']
+    dump_many.field_names = frozenset(name for name, field in dump_fields)
+    dump_many.source = source
+    dump_many.variants = {}
+    return dump_many
+
+
+def get_compiled_dump(schema, max_variants=128):
+    """
+    The compiled dump of `schema`'s class matching the fields of this
+    instance, compiling variants for `only` / `exclude` on first use.
+    """
+    dump = schema._compiled_dump
+    if dump is None:
+        return None
+    names = frozenset(schema.dump_fields)
+    if names == dump.field_names:
+        return dump
+    variant = dump.variants.get(names)
+    if variant is None and len(dump.variants) < max_variants:
+        variant = dump.variants[names] = compile_dump(type(schema), names)
+    return variant
@@ -0,0 +1,172 @@
+import asyncio
+import zlib
+from collections import OrderedDict
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def add_vary(response, name):
+    vary = [value.strip() for value in response.headers.get('Vary', '').split(',') if value.strip()]
+    if name not in vary:
+        vary.append(name)
+        response.headers['Vary'] = ', '.join(vary)
+
+
+# Codings `coding_etag` may suffix an etag with
+CODINGS = ('zstd', 'br', 'gzip')
+
+
+def coding_etag(etag, encoding):
+    """
+    The etag of the `encoding` coded bytes of a representation. It stays
+    strong, `strip_coding` gives back the etag of the representation.
+    """
+    if etag.startswith('W/'):
+        return etag
+    return '{}-{}"'.format(etag[:-1], encoding)
+
+
+def strip_coding(etag):
+    for coding in CODINGS:
+        suffix = '-{}"'.format(coding)
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def parse_accept_encoding(header):
+    """
+    `{coding: q}` of an `Accept-Encoding` header.
+    """
+    codings = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class Compression:
+    """
+    Compress response bodies with the best coding the client accepts.
+
+    Bodies under `min_size` are sent as they are, bodies from
+    `thread_threshold` on are compressed in `executor` (the loop's default
+    one without it) so the event loop isn't blocked. Compressed bodies of
+    responses with an ETag are kept in an LRU of `cache_size` entries, so
+    a hot response is compressed once per coding.
+    """
+    min_size = 1024
+    thread_threshold = 64 * 1024
+    cache_size = 256
+    gzip_level = 6
+    brotli_quality = 5
+    zstd_level = 3
+
+    def __init__(self, min_size=None, thread_threshold=None, cache_size=None, executor=None):
+        if min_size is not None:
+            self.min_size = min_size
+        if thread_threshold is not None:
+            self.thread_threshold = thread_threshold
+        if cache_size is not None:
+            self.cache_size = cache_size
+        self.executor = executor
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        # In order of preference between equally accepted codings
+        self.encoders = OrderedDict()
+        if zstandard is not None:
+            self.encoders['zstd'] = self.compress_zstd
+        if brotli is not None:
+            self.encoders['br'] = self.compress_brotli
+        self.encoders['gzip'] = self.compress_gzip
+
+    def compress_gzip(self, data):
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_brotli(self, data):
+        return brotli.compress(data, quality=self.brotli_quality)
+
+    def compress_zstd(self, data):
+        return zstandard.ZstdCompressor(level=self.zstd_level).compress(data)
+
+    def select_encoding(self, request):
+        """
+        The accepted coding with the highest q, `None` for identity.
+        """
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        best, best_q = None, 0.0
+        for coding in self.encoders:
+            q = accepted.get(coding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    async def compress(self, data, encoding):
+        encode = self.encoders[encoding]
+        if len(data) >= self.thread_threshold:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, encode, data)
+        return encode(data)
+
+    async def compress_response(self, request, response):
+        """
+        Compress the body of `response` in place when it's worth it.
+        """
+        if not isinstance(response, web.Response) or 'Content-Encoding' in response.headers:
+            return response
+        body = response.body
+        if not isinstance(body, bytes) or len(body) < self.min_size:
+            return response
+        add_vary(response, 'Accept-Encoding')
+        encoding = self.select_encoding(request)
+        if encoding is None:
+            return response
+
+        etag = response.headers.get('ETag')
+        key = (request.path, etag, response.content_type, encoding) if etag else None
+        compressed = self._cache.get(key) if key else None
+        if compressed is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            compressed = await self.compress(body, encoding)
+            if key:
+                self._cache[key] = compressed
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        response.body = compressed
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.headers['ETag'] = coding_etag(etag, encoding)
+        return response
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._cache),
+        }
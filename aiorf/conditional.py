@@ -0,0 +1,127 @@
+import hashlib
+
+from aiohttp import web
+from marshmallow.utils import get_value
+
+from aiorf.compression import strip_coding
+from aiorf.exceptions import PreconditionFailed
+from aiorf.metrics import timed
+from aiorf.renderers import default_renderer, render_response
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return '"{}"'.format(digest[:32])
+
+
+def body_etag(body):
+    return '"{}"'.format(hashlib.sha1(body).hexdigest()[:32])
+
+
+def parse_etags(header):
+    """
+    Entity tags of an `If-Match` / `If-None-Match` header as `(etag, weak)`
+    pairs, the `W/` prefix moved to the flag and the content coding suffix
+    of compressed responses removed.
+    """
+    etags = set()
+    for etag in header.split(','):
+        etag = etag.strip()
+        weak = etag.startswith('W/')
+        if weak:
+            etag = etag[2:]
+        if etag:
+            etags.add((strip_coding(etag), weak))
+    return etags
+
+
+def is_conditional(request):
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def is_not_modified(request, etag, last_modified=None):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # Weak comparison, RFC 7232 section 3.2
+        etags = {tag for tag, weak in parse_etags(if_none_match)}
+        return '*' in etags or etag in etags
+    if last_modified is not None and request.if_modified_since is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=request.if_modified_since.tzinfo)
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def get_validators(obj, etag_field=None, last_modified_field=None):
+    """
+    `(etag, last_modified)` read off a row or model instance, `None` for
+    what the view doesn't declare a field for.
+    """
+    last_modified = get_value(obj, last_modified_field, None) if last_modified_field else None
+    if etag_field:
+        etag = make_etag(get_value(obj, etag_field, None))
+    elif last_modified is not None:
+        etag = make_etag(last_modified)
+    else:
+        etag = None
+    return etag, last_modified
+
+
+def get_etag(obj, dump, etag_field=None, last_modified_field=None, renderer=default_renderer):
+    """
+    The etag a GET of `obj` would carry, hashing the rendered body if needed.
+    """
+    etag, last_modified = get_validators(obj, etag_field, last_modified_field)
+    if etag is None:
+        etag = body_etag(renderer.render(dump(obj)))
+    return etag
+
+
+def check_if_match(request, etag):
+    """
+    Fail with 412 unless `If-Match` is absent or lists the current etag.
+    The comparison is strong, RFC 7232 section 3.1: weak tags never match.
+    """
+    if_match = request.headers.get('If-Match')
+    if if_match is None:
+        return
+    etags = {tag for tag, weak in parse_etags(if_match) if not weak}
+    if '*' not in etags and etag not in etags:
+        raise PreconditionFailed
+
+
+def not_modified(etag, last_modified=None):
+    response = web.Response(status=web.HTTPNotModified.status_code)
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def conditional_response(request, dump, etag=None, last_modified=None, headers=None,
+                         renderer=default_renderer):
+    """
+    Response rendering `dump()` carrying an ETag, or a 304.
+
+    When the etag is known up front the 304 is sent without calling
+    `dump`; otherwise the etag is a hash of the rendered body, which
+    differs between renderers.
+    """
+    if etag is not None and is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    with timed('dump'):
+        data = dump()
+    if etag is None:
+        with timed('render'):
+            body = renderer.render(data)
+        etag = body_etag(body)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+        response = web.Response(body=body, content_type=renderer.media_type, headers=headers)
+        response.headers['Vary'] = 'Accept'
+    else:
+        response = render_response(renderer, data, headers=headers)
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
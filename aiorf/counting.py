@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict, namedtuple
+
+import sqlalchemy as sa
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATE = 'estimate'
+
+Total = namedtuple('Total', ['value', 'source'])
+
+
+def count_headers(total):
+    """
+    `X-Total-Count` plus headers telling the client how it was obtained.
+    """
+    return {
+        'X-Total-Count': str(total.value),
+        'X-Total-Count-Source': total.source,
+        'X-Total-Count-Estimated': 'true' if total.source == ESTIMATE else 'false',
+    }
+
+
+class ExactCount:
+    """
+    `SELECT count(*)` over the filtered query, on every request.
+    """
+    async def count_query(self, conn, query, view):
+        value = await conn.fetchval(
+            sa.select([sa.func.count()]).select_from(query.alias('foo'))
+        )
+        return Total(value, EXACT)
+
+    async def count_queryset(self, queryset, view):
+        return Total(await view.read_manager.count(queryset), EXACT)
+
+
+class CachedCount:
+    """
+    Exact counts remembered for `ttl` seconds per normalized filter.
+
+    The key is the compiled SQL and its parameters, so requests that only
+    differ in query string order or paging share an entry.
+    """
+    def __init__(self, ttl=60, maxsize=1024, strategy=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.strategy = strategy or ExactCount()
+        self._cache = OrderedDict()
+
+    def _get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return value
+
+    def _set(self, key, value):
+        self._cache[key] = (time.monotonic() + self.ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+
+    async def count_query(self, conn, query, view):
+        compiled = query.compile()
+        key = (str(compiled), tuple(sorted(compiled.params.items())))
+        value = self._get(key)
+        if value is not None:
+            return Total(value, CACHED)
+        total = await self.strategy.count_query(conn, query, view)
+        self._set(key, total.value)
+        return total
+
+    async def count_queryset(self, queryset, view):
+        sql, params = queryset.sql()
+        key = (sql, tuple(params))
+        value = self._get(key)
+        if value is not None:
+            return Total(value, CACHED)
+        total = await self.strategy.count_queryset(queryset, view)
+        self._set(key, total.value)
+        return total
+
+
+class EstimatedCount:
+    """
+    Row count estimate from the Postgres planner.
+
+    Unfiltered queries read `pg_class.reltuples`, filtered ones the row
+    estimate of `EXPLAIN`. Estimates below `exact_below` are replaced by an
+    exact count, small results are cheap to count and easy to get wrong.
+    """
+    def __init__(self, exact_below=1000):
+        self.exact_below = exact_below
+        self.exact = ExactCount()
+
+    async def count_query(self, conn, query, view):
+        if getattr(query, '_whereclause', None) is None:
+            value = await conn.fetchval(
+                sa.text('SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:name AS regclass)')
+                .bindparams(name=view.model.__table__.fullname))
+        else:
+            plan = await conn.explain(query)
+            value = plan[0]['Plan']['Plan Rows']
+        if value is None or value < self.exact_below:
+            return await self.exact.count_query(conn, query, view)
+        return Total(int(value), ESTIMATE)
+
+    async def count_queryset(self, queryset, view):
+        model = queryset.model_class
+        if queryset._where is None:
+            value = await view.read_manager.scalar(model.raw(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                model._meta.db_table))
+        else:
+            sql, params = queryset.sql()
+            plan = await view.read_manager.scalar(model.raw('EXPLAIN (FORMAT JSON) {}'.format(sql), *params))
+            value = plan[0]['Plan']['Plan Rows']
+        if value is None or value < self.exact_below:
+            return await self.exact.count_queryset(queryset, view)
+        return Total(int(value), ESTIMATE)
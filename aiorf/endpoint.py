@@ -1,48 +1,31 @@
 import json
+import uuid
 from enum import Enum
 
 from aiohttp import web
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 
 # TODO import apispec
 from aiohttp_security import permits
 
-class RESTError(web.HTTPError):
-    status_code = 500
-    error = "Unknown Error"
-
-    def __init__(self, message=None, status_code=None, **kwargs):
-
-        if status_code is not None:
-            self.status_code = status_code
-
-        super().__init__(reason=message)
-        if not message:
-            message = self.error
-
-        msg_dict = {"error": message}
-
-        if kwargs:
-            msg_dict['error_details'] = kwargs
-
-        self.text = json.dumps(msg_dict)
-        self.content_type = 'application/json'
-
-class ForbiddenError(RESTError):
-    status_code = 401
-    error = "Access denied"
-
-class NotFoundError(RESTError):
-    status_code = 404
-    error = "Not found"
-
-class MethodNotAllowed(RESTError):
-    status_code = 405
-    error = "Method not allowed"
-
-class BadRequest(RESTError):
-    status_code = 400
-    error = 'Bad request'
+from aiorf.admission import Admission
+from aiorf.backends import get_backend
+from aiorf.coalesce import copy_response
+from aiorf.compression import Compression, add_vary
+from aiorf.conditional import (
+    check_if_match, conditional_response, get_etag, get_validators, is_not_modified, make_etag, not_modified)
+from aiorf.counting import ExactCount, count_headers
+from aiorf.exceptions import RESTError, ForbiddenError, NotFoundError, MethodNotAllowed, BadRequest
+from aiorf.fieldsets import get_attribute_names, get_fieldset, narrow_schema
+from aiorf.filters import FilterSet
+from aiorf.imports import ImportResult, get_import_format, group_columns, load_batches
+from aiorf.metrics import default_metrics, start_timings, stop_timings, timed
+from aiorf.relations import get_relations, load_related
+from aiorf.replicas import SAFE_METHODS, ReplicaSet, is_sticky, reads_from_primary, reset_primary, set_sticky, use_primary
+from aiorf.renderers import ArrowRenderer, JSONRenderer, MessagePackRenderer, render_response, select_renderer
+from aiorf.statements import Statement
+from aiorf.streaming import CSV, content_types, get_export_format, get_stream_format, stream_response
 
 
 async def require(request, permission):
@@ -58,155 +41,664 @@ class Endpoint:
     lookup_field = 'id'
     lookup_regex = '\d+'
     filters = []
+    pagination_class = None
+    count_strategy = ExactCount()
+    object_cache = None
+    etag_field = None
+    last_modified_field = None
+    single_flight = None
+    prepare_statements = False
+    max_cached_statements = 256
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+    # Credentials are part of the key, other users' rows are never shared
+    coalesce_vary = ('Accept', 'Accept-Encoding', 'If-None-Match', 'If-Modified-Since', 'Authorization', 'Cookie')
     path = '/endpoint'
-
-    def __init__(self, pool):
+    stream = False
+    stream_format = 'json'
+    stream_batch_size = 1000
+    bulk_batch_size = 1000
+    bulk_max_rows = None
+    import_batch_size = 5000
+    import_max_errors = 100
+    import_error_limit = None
+    collection_methods = {'get': 'list', 'post': 'post', 'patch': 'bulk_update', 'delete': 'bulk_delete'}
+    # {path}/<name> routes: name -> (method, handler method)
+    collection_actions = {'import': ('POST', 'bulk_import'), 'export': ('GET', 'export')}
+    export_format = CSV
+    export_compress = True
+    filter_lookups = FilterSet.lookups
+    renderer_classes = (JSONRenderer, MessagePackRenderer, ArrowRenderer)
+    compression = Compression()
+    admission = Admission()
+    sticky_seconds = 5
+    metrics = default_metrics
+    server_timing = False
+
+    def __init__(self, pool, replicas=()):
+        """
+        `replicas` are pools serving reads, see `ReplicaSet`.
+        """
         self.pool = pool
+        self.backend = ReplicaSet(pool, replicas) if replicas else get_backend(pool)
+        if self.metrics is not None:
+            for role, backend in self.backend.get_pools():
+                self.metrics.register_pool(backend, role)
 
     async def dispatch(self, request):
         method = request.method.lower()
         if not hasattr(self, method):
             raise MethodNotAllowed
         if 'id' not in request.match_info:
-            method = 'list'
-        return await getattr(self, method)(request, *request.match_info.values())
+            method = self.collection_methods.get(method)
+            if method is None:
+                raise MethodNotAllowed
+        args = request.match_info.values()
+        if (method in ('get', 'list') and self.single_flight is not None and not self.stream
+                and not is_sticky(request)):
+            return await self.coalesce(request, method, *args)
+        return await self.handle(request, method, *args)
+
+    async def handle(self, request, method, *args):
+        timings, timings_token = start_timings()
+        token = use_primary(reads_from_primary(request))
+        # Anything but an HTTP error escaping is a 500
+        status = 500
+        try:
+            async with self.admission.admit(request.method):
+                response = await getattr(self, method)(request, *args)
+            response = await self.finalize_response(request, response)
+            status = 200 if response is None else response.status
+        except web.HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            reset_primary(token)
+            stop_timings(timings_token)
+            timings.finish()
+            if self.metrics is not None:
+                self.metrics.observe(type(self).__name__, request.method, status, timings)
+        if self.server_timing and response is not None and not response.prepared:
+            response.headers['Server-Timing'] = timings.header()
+        return response
+
+    async def finalize_response(self, request, response):
+        """
+        Last step of every response: keeping a writing client on the
+        primary for `sticky_seconds`, and compressing the body.
+        """
+        if (isinstance(self.backend, ReplicaSet) and request.method not in SAFE_METHODS
+                and response is not None and response.status < 400):
+            set_sticky(response, self.sticky_seconds)
+        if self.compression is not None:
+            with timed('compress'):
+                response = await self.compression.compress_response(request, response)
+        return response
+
+    def get_renderers(self):
+        """
+        Instances of the available `renderer_classes`, created once per
+        endpoint class.
+        """
+        cls = type(self)
+        renderers = cls.__dict__.get('_renderers')
+        if renderers is None:
+            renderers = cls._renderers = [renderer() for renderer in self.renderer_classes if renderer.available]
+        return renderers
+
+    def get_renderer(self, request):
+        return select_renderer(request, self.get_renderers())
+
+    def render(self, request, data, status=200, headers=None):
+        return render_response(self.get_renderer(request), data, status=status, headers=headers)
+
+    def get_coalesce_key(self, request):
+        """
+        Requests with equal keys share one response, so everything the
+        response depends on must be part of the key.
+        """
+        return (request.host, request.path_qs) + tuple(
+            request.headers.get(name) for name in self.coalesce_vary)
+
+    async def coalesce(self, request, method, *args):
+        async def run():
+            try:
+                return await self.handle(request, method, *args)
+            except web.HTTPException as exc:
+                return exc
+        response = await self.single_flight.do(self.get_coalesce_key(request), run)
+        return copy_response(response)
+
+    def build_statements(self):
+        """
+        The standard statements of the endpoint, with a `lookup` parameter.
+        """
+        table = self.model.__table__
+        where = getattr(self.model, self.lookup_field) == sa.bindparam('lookup')
+        return {
+            'retrieve': table.select().where(where),
+            'lock': table.select().where(where).with_for_update(),
+            'destroy': table.delete().where(where),
+        }
+
+    def get_statement(self, name):
+        """
+        A `Statement` built and compiled once per endpoint class.
+        """
+        cls = type(self)
+        statements = cls.__dict__.get('_statements')
+        if statements is None:
+            statements = {
+                key: Statement(query, self.backend.dialect, prepare=self.prepare_statements)
+                for key, query in self.build_statements().items()
+            }
+            cls._statements = statements
+        return statements[name]
+
+    def get_fieldset(self, request):
+        return get_fieldset(request, self.fields_query_param, self.exclude_query_param)
+
+    def get_schema(self, fieldset=(None, None)):
+        """
+        The schema narrowed to a `(only, exclude)` fieldset.
+        """
+        only, exclude = fieldset
+        if only is None and exclude is None:
+            return self.schema
+        return narrow_schema(type(self.schema), only, exclude)
+
+    def get_columns(self, schema, paginator=None):
+        """
+        Columns to select for `schema`, keeping the primary key, lookup,
+        validator and ordering columns the endpoint reads itself.
+        """
+        table = self.model.__table__
+        pk_name = list(table.primary_key.columns)[0].name
+        extra = [pk_name, self.lookup_field, self.etag_field, self.last_modified_field]
+        if paginator is not None:
+            extra.extend(paginator.get_ordering(self, pk_name)[0])
+        names = get_attribute_names(schema, extra)
+        return [column for column in table.c if column.name in names]
+
+    def get_cached_statement(self, key, build):
+        """
+        A `Statement` of the query `build()` returns, compiled once per
+        endpoint class and `key`.
+        """
+        cls = type(self)
+        statements = cls.__dict__.get('_cached_statements')
+        if statements is None:
+            statements = cls._cached_statements = {}
+        statement = statements.get(key)
+        if statement is None:
+            statement = Statement(build(), self.backend.dialect, prepare=self.prepare_statements)
+            if len(statements) < self.max_cached_statements:
+                statements[key] = statement
+        return statement
+
+    def get_retrieve_statement(self, columns):
+        """
+        The `retrieve` statement selecting only `columns`.
+        """
+        def build():
+            where = getattr(self.model, self.lookup_field) == sa.bindparam('lookup')
+            return sa.select(columns).where(where)
+        return self.get_cached_statement(('retrieve', tuple(column.name for column in columns)), build)
+
+    def get_write_statement(self, kind, names):
+        """
+        `INSERT ... RETURNING` (`kind` 'create') or `UPDATE ... WHERE
+        lookup RETURNING` ('update') setting the columns in `names` from
+        `set_<name>` parameters, compiled once per set of names.
+        """
+        table = self.model.__table__
+        if not names:
+            raise BadRequest('No fields given')
+        unknown = [name for name in names if name not in table.c]
+        if unknown:
+            raise BadRequest('Unknown fields', fields=unknown)
+
+        def build():
+            values = {name: sa.bindparam('set_{}'.format(name), type_=table.c[name].type) for name in names}
+            if kind == 'create':
+                query = table.insert()
+            else:
+                query = table.update().where(getattr(self.model, self.lookup_field) == sa.bindparam('lookup'))
+            return query.values(values).returning(*table.c)
+        return self.get_cached_statement((kind, names), build)
+
+    def get_write_params(self, data, object_id=None):
+        params = {'set_{}'.format(name): value for name, value in data.items()}
+        if object_id is not None:
+            params['lookup'] = object_id
+        return params
 
     async def get_object(self, object_id):
-        async with self.pool.acquire() as conn:
-            query = self.model.__table__.select().where(getattr(self.model, self.lookup_field) == object_id)
-            row = await conn.execute(query)
-            rec = await row.first()
+        if self.object_cache is not None:
+            return await self.object_cache.get_or_load(
+                self.model, object_id, lambda: self.load_object(object_id))
+        return await self.fetch_object(object_id)
+
+    async def load_object(self, object_id):
+        """
+        Fill the object cache from the primary, a lagging replica would
+        put back rows that a write just invalidated.
+        """
+        token = use_primary(True)
+        try:
+            return await self.fetch_object(object_id)
+        finally:
+            reset_primary(token)
+
+    async def fetch_object(self, object_id, columns=None):
+        if columns is None:
+            statement = self.get_statement('retrieve')
+        else:
+            statement = self.get_retrieve_statement(columns)
+        async with self.backend.acquire() as conn:
+            rec = await conn.fetchrow(statement, {'lookup': object_id})
         if not rec:
             raise NotFoundError
-        return rec
+        # Plain dicts outlive the connection and can go to any cache backend
+        return dict(rec) if self.object_cache is not None else rec
+
+    async def invalidate_object(self, object_id=None):
+        """
+        Drop one cached object, or all objects of the model without an id.
+        """
+        if self.object_cache is None:
+            return
+        if object_id is None:
+            self.object_cache.invalidate_model(self.model)
+        else:
+            await self.object_cache.invalidate(self.model, object_id)
 
     async def get(self, request, object_id):
         # await require(request, Permissions.view)
-        rec = await self.get_object(object_id)
-        return web.json_response(self.schema.dump(rec))
+        renderer = self.get_renderer(request)
+        fieldset = self.get_fieldset(request)
+        schema = self.get_schema(fieldset)
+        if schema is self.schema or self.object_cache is not None:
+            # The cache holds whole rows, narrowing them is free
+            rec = await self.get_object(object_id)
+        else:
+            rec = await self.fetch_object(object_id, self.get_columns(schema))
+        rec = (await self.load_related(schema, [rec]))[0]
+        etag, last_modified = get_validators(rec, self.etag_field, self.last_modified_field)
+        if etag is not None and schema is not self.schema:
+            # Every fieldset is a representation of its own
+            etag = make_etag(etag, fieldset)
+        return conditional_response(request, lambda: schema.dump(rec), etag, last_modified, renderer=renderer)
+
+    async def check_precondition(self, request, object_id, conn):
+        """
+        Compare `If-Match` with the stored object, bypassing the object cache.
+        The row stays locked until the transaction `conn` is in ends.
+        """
+        rec = await conn.fetchrow(self.get_statement('lock'), {'lookup': object_id})
+        if not rec:
+            raise NotFoundError
+        # The body a GET hashes has the relations in
+        rec = (await self.load_related(self.schema, [rec], conn))[0]
+        etag = get_etag(rec, self.schema.dump, self.etag_field, self.last_modified_field,
+                        renderer=self.get_renderer(request))
+        check_if_match(request, etag)
+
+    async def get_list_validators(self, conn, query):
+        """
+        List etag and last modified computed by the database, `(None, None)`
+        without validator fields. The etag hashes every row's primary key
+        and validator, so it changes with any row rather than only the newest.
+        """
+        if not self.etag_field and not self.last_modified_field:
+            return None, None
+        alias = query.alias('foo')
+        pk = alias.c[list(self.model.__table__.primary_key.columns)[0].name]
+        validator = alias.c[self.etag_field or self.last_modified_field]
+        columns = [
+            sa.func.count(),
+            sa.func.md5(sa.func.string_agg(
+                sa.cast(pk, sa.Text) + ':' + sa.cast(validator, sa.Text), aggregate_order_by(',', pk))),
+        ]
+        if self.last_modified_field:
+            columns.append(sa.func.max(alias.c[self.last_modified_field]))
+        row = await conn.fetchrow(sa.select(columns).select_from(alias))
+        last_modified = row[-1] if self.last_modified_field else None
+        return make_etag(tuple(row)), last_modified
 
     async def list(self, request):
         # await require(request, Permissions.view)
-        # def text_filter(query, value, table):
-        #     pairs = ((n, c) for n, c in table.c.items()
-        #              if isinstance(c.type, sa.sql.sqltypes.String))
-        #     sub_queries = []
-        #     for name, column in pairs:
-        #         do_compare = op("like", column)
-        #         sub_queries.append(do_compare(column, value))
-        #
-        #     query = query.where(or_(*sub_queries))
-        #     return query
-        async with self.pool.acquire() as conn:
-            query = self.model.__table__.select()
-            count = await conn.scalar(
-                sa.select([sa.func.count()]).select_from(query.alias('foo'))
-            )
-            # sort_dir = sa.asc if paging.sort_dir == ASC else sa.desc
-            cursor = await conn.execute(query)
-            # .offset(paging.offset)
-            # .limit(paging.limit)
-            # .order_by(sort_dir(paging.sort_field)))
-
-            recs = await cursor.fetchall()
-            headers = {'X-Total-Count': str(count)}
-            return web.json_response(self.schema.dump(recs, many=True), headers=headers)
+        paginator = self.pagination_class() if self.pagination_class else None
+        schema = self.get_schema(self.get_fieldset(request))
+        columns = None if schema is self.schema else self.get_columns(schema, paginator)
+        query = self.model.__table__.select() if columns is None else sa.select(columns)
+        shape, params = self.get_filters(request)
+        query = self.apply_filters(query, shape, params)
+        async with self.backend.acquire() as conn:
+            headers = {}
+            if self.stream:
+                if paginator is None or paginator.count:
+                    headers.update(count_headers(await self.count_strategy.count_query(conn, query, self)))
+                return await stream_response(
+                    request,
+                    self.iter_related(conn, schema, conn.cursor(query, self.stream_batch_size)),
+                    lambda recs: schema.dump(recs, many=True),
+                    fmt=get_stream_format(request, self.stream_format),
+                    headers=headers)
+            page = query if paginator is None else paginator.paginate_query(query, request, self)
+            etag, last_modified = await self.get_list_validators(conn, page)
+            if etag is not None:
+                # The same rows under other page/cursor parameters are another representation
+                etag = make_etag(etag, request.query_string)
+                # Before counting, a 304 costs the validator query alone
+                if is_not_modified(request, etag, last_modified):
+                    return not_modified(etag, last_modified)
+            if paginator is None or paginator.count:
+                headers.update(count_headers(await self.count_strategy.count_query(conn, query, self)))
+            query = page
+            if paginator is None:
+                # Keyset positions vary per page, whole lists only vary in filter values
+                key = ('list', columns and tuple(column.name for column in columns), shape)
+                recs = await conn.fetch(self.get_cached_statement(key, lambda: query), params)
+            else:
+                recs = await conn.fetch(query)
+            if paginator is not None:
+                recs = paginator.paginate_rows(recs)
+                headers.update(paginator.get_headers())
+            recs = await self.load_related(schema, recs, conn)
+            return conditional_response(
+                request, lambda: schema.dump(recs, many=True), etag, last_modified, headers=headers,
+                renderer=self.get_renderer(request))
+
+    async def load_related(self, schema, recs, conn=None):
+        """
+        Rows with the related rows of `schema`'s `ForeignKey` fields
+        stitched in, one query per relation.
+        """
+        if not get_relations(schema):
+            return recs
+        if conn is None:
+            async with self.backend.acquire() as conn:
+                return await load_related(conn, self.model.__table__, schema, recs)
+        return await load_related(conn, self.model.__table__, schema, recs)
+
+    async def iter_related(self, conn, schema, batches):
+        async for batch in batches:
+            yield await self.load_related(schema, batch, conn)
 
     async def post(self, request):
         # await require(request, Permissions.view)
         data = await request.json()
+        if isinstance(data, list):
+            return await self.bulk_create(request, data)
         errors = self.schema.validate(data)
         if errors:
             raise BadRequest(errors)
-        async with self.pool.acquire() as conn:
-            query = self.model.__table__.insert().values(data)
-            rec = await conn.execute(query)
-            await conn.execute('commit;')
-
-    async def put(self, request, object_id):
+        statement = self.get_write_statement('create', tuple(sorted(data)))
+        async with self.backend.acquire() as conn:
+            rec = await conn.fetchrow(statement, self.get_write_params(data))
+            recs = await self.load_related(self.schema, [rec], conn)
+        return self.render(request, self.schema.dump(recs[0]), status=web.HTTPCreated.status_code)
+
+    async def bulk_create(self, request, data):
+        """
+        Insert a list of objects with multi-row `INSERT ... RETURNING`
+        statements of up to `bulk_batch_size` rows, all in one transaction.
+        Nothing is inserted if any item fails validation.
+        """
+        errors = self.schema.validate(data, many=True)
+        if errors:
+            raise BadRequest('Invalid items', items=errors)
+        table = self.model.__table__
+        created = []
+        async with self.backend.acquire() as conn:
+            async with conn.transaction():
+                for start in range(0, len(data), self.bulk_batch_size):
+                    batch = data[start:start + self.bulk_batch_size]
+                    # Multi-row VALUES need the same keys in every row
+                    keys = {key for item in batch for key in item}
+                    values = [{key: item.get(key, sa.literal_column('DEFAULT')) for key in keys}
+                              for item in batch]
+                    created.extend(await conn.fetch(table.insert().values(values).returning(*table.c)))
+            created = await self.load_related(self.schema, created, conn)
+        return self.render(request, self.schema.dump(created, many=True), status=web.HTTPCreated.status_code)
+
+    async def bulk_import(self, request):
+        """
+        Import a streamed NDJSON or CSV body (`POST {path}/import`).
+
+        Rows are validated `import_batch_size` at a time and copied into a
+        temporary staging table, which goes into the model's table with one
+        `INSERT ... SELECT` at the end: either every valid row is imported
+        or none is. Invalid rows are skipped and reported, the first
+        `import_max_errors` of them; past `import_error_limit` the import
+        fails. The connection is held while the body streams in.
+        """
+        fmt = get_import_format(request)
+        table = self.model.__table__
+        preparer = self.backend.dialect.identifier_preparer
+        staging = 'aiorf_import_{}'.format(uuid.uuid4().hex)
+        result = ImportResult(self.import_max_errors)
+        columns = {}
+        async with self.backend.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('CREATE TEMPORARY TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP'.format(
+                    staging, preparer.format_table(table)))
+                batches = load_batches(request, fmt, self.schema, self.import_batch_size, result,
+                                       self.import_error_limit)
+                async for rows in batches:
+                    for names, records in group_columns(rows):
+                        columns.update(dict.fromkeys(names))
+                        await conn.copy_records(staging, names, records)
+                if columns:
+                    names = ', '.join(preparer.quote(name) for name in columns)
+                    result.imported = await conn.execute('INSERT INTO {} ({}) SELECT {} FROM {}'.format(
+                        preparer.format_table(table), names, names, staging))
+        return self.render(request, result.as_dict())
+
+    async def export(self, request):
+        """
+        Stream the rows matching the filters (`GET {path}/export`) as CSV
+        with a header or as NDJSON, see `get_export_format`.
+
+        Postgres writes them with `COPY (SELECT ...) TO STDOUT` and the
+        bytes go straight to the response, gzipped on the fly with
+        `export_compress` when the client accepts it. Columns are those of
+        the fieldset; values are in Postgres' own text representation, not
+        dumped by the schema.
+        """
+        fmt = get_export_format(request, self.export_format)
+        table = self.model.__table__
+        names = get_attribute_names(self.get_schema(self.get_fieldset(request)))
+        shape, params = self.get_filters(request)
+        query = self.apply_filters(sa.select([column for column in table.c if column.name in names]), shape, params)
+        response = web.StreamResponse(headers={
+            'Content-Disposition': 'attachment; filename="{}.{}"'.format(table.name, fmt),
+        })
+        response.content_type = content_types[fmt]
+        response.enable_chunked_encoding()
+        if self.export_compress:
+            response.enable_compression()
+            add_vary(response, 'Accept-Encoding')
+        async with self.backend.acquire() as conn:
+            await response.prepare(request)
+            await conn.copy_query(query, response.write, fmt)
+        await response.write_eof()
+        return response
+
+    def get_action_handler(self, method):
+        async def handler(request):
+            return await self.handle(request, method)
+        return handler
+
+    async def put(self, request, object_id, partial=False):
+        """
+        Update with a single `UPDATE ... RETURNING` round trip, a missing
+        object shows as no row coming back. Only `If-Match` adds a locking
+        read, in the same transaction.
+        """
         # await require(request, Permissions.edit)
         data = await request.json()
-        rec = await self.get_object(object_id)
-        errors = self.schema.validate(data)
+        errors = self.schema.validate(data, partial=partial)
         if errors:
             raise BadRequest(errors)
-        async with self.pool.acquire() as conn:
-            row = await conn.execute(
-                self.model.__table__.update()
-                    .values(data))
-                    # .returning(*self.__table__.c)
-                    # .where(self._pk == entity_id))
-            await conn.execute('commit;')
+        statement = self.get_write_statement('update', tuple(sorted(data)))
+        params = self.get_write_params(data, object_id)
+        async with self.backend.acquire() as conn:
+            if 'If-Match' in request.headers:
+                async with conn.transaction():
+                    await self.check_precondition(request, object_id, conn)
+                    rec = await conn.fetchrow(statement, params)
+            else:
+                rec = await conn.fetchrow(statement, params)
+            if not rec:
+                raise NotFoundError
+            rec = (await self.load_related(self.schema, [rec], conn))[0]
+        await self.invalidate_object(object_id)
+        return self.render(request, self.schema.dump(rec))
 
     async def patch(self, request, object_id):
-        return await self.put(request, object_id)
+        return await self.put(request, object_id, partial=True)
 
     async def delete(self, request, object_id):
         # await require(request, Permissions.delete)
-        async with self.pool.acquire() as conn:
-            query = self.model.__table__.delete().where(getattr(self.model, self.lookup_field) == object_id)
-            await conn.execute(query)
-            # TODO: Think about autocommit by default
-            await conn.execute('commit;')
+        statement = self.get_statement('destroy')
+        async with self.backend.acquire() as conn:
+            if 'If-Match' in request.headers:
+                async with conn.transaction():
+                    await self.check_precondition(request, object_id, conn)
+                    affected = await conn.execute(statement, {'lookup': object_id})
+            else:
+                affected = await conn.execute(statement, {'lookup': object_id})
+        if not affected:
+            raise NotFoundError
+        await self.invalidate_object(object_id)
+        return web.Response(status=web.HTTPNoContent.status_code)
+
+    def get_filterset(self):
+        """
+        The `FilterSet` of `filters`, built once per endpoint class.
+        """
+        cls = type(self)
+        filterset = cls.__dict__.get('_filterset')
+        if filterset is None:
+            filterset = cls._filterset = FilterSet(self.filters, self.filter_lookups)
+        return filterset
+
+    def get_filters(self, request, strict=False):
+        """
+        `(shape, params)` of the filters in the query string, as
+        `field=value` or `field__lookup=value` for fields listed in `filters`.
+        """
+        filterset = self.get_filterset()
+        shape, values = filterset.parse(request.query, strict)
+        return shape, filterset.get_params(self.model.__table__, shape, values)
+
+    def apply_filters(self, query, shape, params):
+        if not shape:
+            return query
+        clause = self.get_filterset().get_clause(self.model.__table__, shape)
+        return query.where(clause.params(params))
+
+    def filter_query(self, request, query):
+        """
+        Narrow a statement by the query string, rejecting any parameter
+        that isn't a filter.
+        """
+        shape, params = self.get_filters(request, strict=True)
+        return self.apply_filters(query, shape, params)
+
+    async def execute_bulk(self, query):
+        """
+        Run a filtered UPDATE or DELETE in a transaction and return the
+        number of affected rows, rolling back if it exceeds `bulk_max_rows`.
+        """
+        async with self.backend.acquire() as conn:
+            async with conn.transaction():
+                affected = await conn.execute(query)
+                if self.bulk_max_rows is not None and affected > self.bulk_max_rows:
+                    raise BadRequest('Too many rows affected', affected=affected, limit=self.bulk_max_rows)
+        await self.invalidate_object()
+        return affected
+
+    async def bulk_update(self, request):
+        # await require(request, Permissions.edit)
+        if not request.query:
+            raise BadRequest('Bulk update requires a filter')
+        data = await request.json()
+        errors = self.schema.validate(data, partial=True)
+        if errors:
+            raise BadRequest(errors)
+        query = self.filter_query(request, self.model.__table__.update().values(data))
+        return self.render(request, {'affected': await self.execute_bulk(query)})
+
+    async def bulk_delete(self, request):
+        # await require(request, Permissions.delete)
+        if not request.query:
+            raise BadRequest('Bulk delete requires a filter')
+        query = self.filter_query(request, self.model.__table__.delete())
+        return self.render(request, {'affected': await self.execute_bulk(query)})
 
     def setup_routes(self, router):
         router.add_route('*', f'{self.path}', self.dispatch)
+        for name, (method, handler) in self.collection_actions.items():
+            router.add_route(method, f'{self.path}/{name}', self.get_action_handler(handler))
         router.add_route('*', f'{self.path}/{{id}}', self.dispatch)
 
 
-import marshmallow_sqlalchemy
-from aiopg.sa import create_engine
-
-import sqlalchemy as sa
-from marshmallow_sqlalchemy import ModelSchema
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import scoped_session, sessionmaker, relationship, backref
+if __name__ == '__main__':
+    import marshmallow_sqlalchemy
+    from aiopg.sa import create_engine
 
-engine = sa.create_engine("postgres://127.0.0.1/test")
-session = scoped_session(sessionmaker(bind=engine))
-Base = declarative_base()
+    import sqlalchemy as sa
+    from marshmallow_sqlalchemy import ModelSchema
+    from sqlalchemy.ext.declarative import declarative_base
+    from sqlalchemy.orm import scoped_session, sessionmaker, relationship, backref
 
-class Author(Base):
-    __tablename__ = "authors"
-    id = sa.Column(sa.Integer, primary_key=True)
-    name = sa.Column(sa.String)
+    engine = sa.create_engine("postgres://127.0.0.1/test")
+    session = scoped_session(sessionmaker(bind=engine))
+    Base = declarative_base()
 
-    def __repr__(self):
-        return "<Author(name={self.name!r})>".format(self=self)
+    class Author(Base):
+        __tablename__ = "authors"
+        id = sa.Column(sa.Integer, primary_key=True)
+        name = sa.Column(sa.String)
 
+        def __repr__(self):
+            return "<Author(name={self.name!r})>".format(self=self)
 
-class AuthorSchema(ModelSchema):
-    class Meta:
-        model = Author
-        transient = True
 
-Base.metadata.create_all(engine)
-author = Author(name="Chuck Paluhniuk")
-session.add(author)
-session.commit()
-author = Author(name="Adolf Hitler")
-session.add(author)
-session.commit()
+    class AuthorSchema(ModelSchema):
+        class Meta:
+            model = Author
+            transient = True
 
-import ipdb
-ipdb.set_trace()
+    Base.metadata.create_all(engine)
+    author = Author(name="Chuck Paluhniuk")
+    session.add(author)
+    session.commit()
+    author = Author(name="Adolf Hitler")
+    session.add(author)
+    session.commit()
 
-class Test(Endpoint):
-    model = Author
-    schema = AuthorSchema()
-    path = '/test'
+    import ipdb
+    ipdb.set_trace()
 
+    class Test(Endpoint):
+        model = Author
+        schema = AuthorSchema()
+        path = '/test'
 
 
-app = web.Application()
-async def on_startup(app):
-    db = await create_engine(database='test')
-    test = Test(db)
-    test.setup_routes(app.router)
 
-# import ipdb
-# ipdb.set_trace()
-# aiohttp_autoreload.start()
-app.on_startup.append(on_startup)
-web.run_app(app)
+    app = web.Application()
+    async def on_startup(app):
+        db = await create_engine(database='test')
+        test = Test(db)
+        test.setup_routes(app.router)
 
+    # import ipdb
+    # ipdb.set_trace()
+    # aiohttp_autoreload.start()
+    app.on_startup.append(on_startup)
+    web.run_app(app)
@@ -0,0 +1,62 @@
+import json
+
+from aiohttp import web
+
+
+class RESTError(web.HTTPError):
+    status_code = 500
+    error = "Unknown Error"
+
+    def __init__(self, message=None, status_code=None, **kwargs):
+
+        if status_code is not None:
+            self.status_code = status_code
+
+        super().__init__(reason=message)
+        if not message:
+            message = self.error
+
+        msg_dict = {"error": message}
+
+        if kwargs:
+            msg_dict['error_details'] = kwargs
+
+        self.text = json.dumps(msg_dict)
+        self.content_type = 'application/json'
+
+class ForbiddenError(RESTError):
+    status_code = 401
+    error = "Access denied"
+
+class NotFoundError(RESTError):
+    status_code = 404
+    error = "Not found"
+
+class MethodNotAllowed(RESTError):
+    status_code = 405
+    error = "Method not allowed"
+
+class BadRequest(RESTError):
+    status_code = 400
+    error = 'Bad request'
+
+class PreconditionFailed(RESTError):
+    status_code = 412
+    error = 'Precondition failed'
+
+class NotAcceptable(RESTError):
+    status_code = 406
+    error = 'Not acceptable'
+
+class ServiceUnavailable(RESTError):
+    status_code = 503
+    error = 'Service unavailable'
+
+    def __init__(self, message=None, retry_after=None, **kwargs):
+        super().__init__(message, **kwargs)
+        if retry_after is not None:
+            self.headers['Retry-After'] = str(retry_after)
+
+class UnsupportedMediaType(RESTError):
+    status_code = 415
+    error = 'Unsupported media type'
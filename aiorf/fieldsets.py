@@ -0,0 +1,54 @@
+import functools
+
+from aiorf.exceptions import BadRequest
+from aiorf.relations import ForeignKey
+
+#: Distinct fieldsets kept compiled per schema class and per endpoint
+max_fieldsets = 128
+
+
+def _parse(value):
+    if value is None:
+        return None
+    names = tuple(sorted({name.strip() for name in value.split(',') if name.strip()}))
+    return names or None
+
+
+def get_fieldset(request, fields_param='fields', exclude_param='exclude'):
+    """
+    `(only, exclude)` field names asked for in the query string, as sorted
+    tuples so that equal fieldsets share their cached schemas and queries.
+    Either is `None` when not given.
+    """
+    return _parse(request.query.get(fields_param)), _parse(request.query.get(exclude_param))
+
+
+@functools.lru_cache(maxsize=max_fieldsets)
+def _get_schema(schema_class, only, exclude):
+    return schema_class(only=only, exclude=exclude or ())
+
+
+def narrow_schema(schema_class, only=None, exclude=None):
+    """
+    A shared instance of `schema_class` dumping only the given fields.
+    """
+    try:
+        return _get_schema(schema_class, only, exclude)
+    except ValueError as exc:
+        # marshmallow rejects names that aren't fields of the schema
+        raise BadRequest(str(exc))
+
+
+def get_attribute_names(schema, extra=()):
+    """
+    Names of the attributes the fields of `schema` read, plus `extra`, i.e.
+    the columns a query has to select for the schema to dump its rows.
+    """
+    names = set(extra)
+    for name, field in schema.dump_fields.items():
+        if isinstance(field, ForeignKey):
+            attribute = field.column or name
+        else:
+            attribute = field.attribute or name
+        names.add(attribute.split('.', 1)[0])
+    return names
@@ -0,0 +1,221 @@
+import functools
+import logging
+import operator
+
+import peewee
+import sqlalchemy as sa
+
+from aiorf.backends import coerce_param, parse_bool
+from aiorf.exceptions import BadRequest
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_SEP = '__'
+
+#: Lookups whose value is a LIKE pattern, as (format, case insensitive)
+patterns = {
+    'contains': ('%{}%', False),
+    'icontains': ('%{}%', True),
+    'startswith': ('{}%', False),
+}
+
+_comparisons = {
+    'exact': '__eq__',
+    'ne': '__ne__',
+    'lt': '__lt__',
+    'lte': '__le__',
+    'gt': '__gt__',
+    'gte': '__ge__',
+}
+
+
+def _escape_like(value):
+    # Backslash is the default LIKE escape of Postgres
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _is_indexed(column):
+    if column.primary_key or column.index or column.unique:
+        return True
+    # Only indexes leading with the column help a filter on it alone
+    for index in column.table.indexes:
+        if list(index.columns)[0] is column:
+            return True
+    return False
+
+
+def _is_indexed_field(field):
+    if field.primary_key or field.index or field.unique:
+        return True
+    return any(fields[0] == field.name for fields, unique in field.model_class._meta.indexes)
+
+
+class FilterSet:
+    """
+    Filters parsed from query parameters such as `price__gte=10`,
+    `id__in=1,2,3` or `deleted__isnull=true`, applied in the database.
+
+    Only names in `fields` can be filtered on. The filters of a request
+    boil down to a shape, the filtered names and lookups with the number
+    of `in` values, and an SQLAlchemy WHERE clause is built once per shape
+    with bind parameters. Requests differing only in values share the
+    clause, and statements compiled from it.
+    """
+    lookups = ('exact', 'ne', 'lt', 'lte', 'gt', 'gte', 'in', 'isnull', 'contains', 'icontains', 'startswith')
+    max_shapes = 256
+
+    def __init__(self, fields, lookups=None):
+        self.fields = frozenset(fields)
+        if lookups is not None:
+            self.lookups = tuple(lookups)
+        self._clauses = {}
+        self._checked = set()
+
+    def parse(self, query, strict=False):
+        """
+        `(shape, values)` of the filters in a query string mapping. Other
+        parameters are left alone, or rejected when `strict`.
+        """
+        shape = []
+        values = {}
+        for key in sorted(set(query)):
+            name, _, lookup = key.partition(LOOKUP_SEP)
+            lookup = lookup or 'exact'
+            if name not in self.fields or lookup not in self.lookups:
+                if strict:
+                    raise BadRequest('Unknown filter {}'.format(key))
+                continue
+            value = query.get(key)
+            if lookup == 'in':
+                value = [item for item in value.split(',') if item]
+                if not value:
+                    raise BadRequest('Empty filter {}'.format(key))
+                shape.append((name, lookup, len(value)))
+            elif lookup == 'isnull':
+                try:
+                    shape.append((name, lookup, parse_bool(value)))
+                except ValueError:
+                    raise BadRequest('Invalid value {!r}'.format(value))
+                continue
+            else:
+                shape.append((name, lookup, None))
+            values[self.get_bind_name(name, lookup)] = value
+        return tuple(shape), values
+
+    def get_bind_name(self, name, lookup):
+        return 'filter_{}_{}'.format(name, lookup)
+
+    def warn_unindexed(self, key, indexed, label):
+        if key in self._checked:
+            return
+        self._checked.add(key)
+        if not indexed:
+            logger.warning('Filtering on %s, which has no index', label)
+
+    def get_clause(self, table, shape):
+        """
+        The WHERE clause of `shape` on `table`, with bind parameters named
+        after the filters.
+        """
+        key = (table, shape)
+        clause = self._clauses.get(key)
+        if clause is not None:
+            return clause
+        clauses = []
+        for name, lookup, arg in shape:
+            column = table.c[name]
+            self.warn_unindexed(column, _is_indexed(column), '{}.{}'.format(table.name, name))
+            bind = self.get_bind_name(name, lookup)
+            if lookup == 'isnull':
+                clauses.append(column.is_(None) if arg else column.isnot(None))
+            elif lookup == 'in':
+                clauses.append(column.in_(
+                    [sa.bindparam('{}_{}'.format(bind, index), type_=column.type) for index in range(arg)]))
+            elif lookup in patterns:
+                param = sa.bindparam(bind, type_=sa.String())
+                like = column.ilike if patterns[lookup][1] else column.like
+                clauses.append(like(param))
+            else:
+                param = sa.bindparam(bind, type_=column.type)
+                clauses.append(getattr(column, _comparisons[lookup])(param))
+        clause = sa.and_(*clauses)
+        if len(self._clauses) < self.max_shapes:
+            self._clauses[key] = clause
+        return clause
+
+    def get_params(self, table, shape, values):
+        """
+        Bind values for the clause of `shape`, parsed into column types.
+        """
+        params = {}
+        for name, lookup, arg in shape:
+            if lookup == 'isnull':
+                continue
+            bind = self.get_bind_name(name, lookup)
+            column = table.c[name]
+            value = values[bind]
+            if lookup == 'in':
+                for index, item in enumerate(value):
+                    params['{}_{}'.format(bind, index)] = coerce_param(column.type, item)
+            elif lookup in patterns:
+                params[bind] = patterns[lookup][0].format(_escape_like(value))
+            else:
+                params[bind] = coerce_param(column.type, value)
+        return params
+
+    def get_expression(self, model, shape, values):
+        """
+        The same filters as a peewee expression on `model`.
+        """
+        expressions = []
+        for name, lookup, arg in shape:
+            field = getattr(model, name)
+            self.warn_unindexed(field, _is_indexed_field(field),
+                                '{}.{}'.format(model._meta.db_table, name))
+            if lookup == 'isnull':
+                expressions.append(field.is_null(arg))
+                continue
+            value = values[self.get_bind_name(name, lookup)]
+            if lookup in patterns:
+                pattern = patterns[lookup][0].format(_escape_like(value))
+                op = peewee.OP.ILIKE if patterns[lookup][1] else peewee.OP.LIKE
+                expressions.append(peewee.Expression(field, op, pattern))
+            elif lookup == 'in':
+                expressions.append(field << [self.coerce_field(field, item) for item in value])
+            else:
+                expressions.append(getattr(field, _comparisons[lookup])(self.coerce_field(field, value)))
+        return functools.reduce(operator.and_, expressions)
+
+    def coerce_field(self, field, value):
+        try:
+            if isinstance(field, peewee.BooleanField):
+                return parse_bool(value)
+            return field.db_value(value)
+        except (ValueError, TypeError):
+            raise BadRequest('Invalid value {!r}'.format(value))
+
+
+class QueryFilterBackend:
+    """
+    `filter_backends` entry filtering a peewee queryset on the
+    `filter_fields` of the view.
+
+    Unsafe methods reject parameters that aren't filters, so that a typo
+    can't widen a bulk update or delete to more rows than meant.
+    """
+    def __init__(self):
+        self._filtersets = {}
+
+    def get_filterset(self, view):
+        filterset = self._filtersets.get(type(view))
+        if filterset is None:
+            filterset = self._filtersets[type(view)] = FilterSet(view.filter_fields)
+        return filterset
+
+    def filter_queryset(self, request, queryset, view):
+        filterset = self.get_filterset(view)
+        strict = request.method not in ('GET', 'HEAD')
+        shape, values = filterset.parse(request.query, strict)
+        if not shape:
+            return queryset
+        return queryset.where(filterset.get_expression(queryset.model_class, shape, values))
@@ -0,0 +1,169 @@
+import codecs
+import csv
+import json
+
+from marshmallow import ValidationError
+
+from aiorf.exceptions import BadRequest, UnsupportedMediaType
+from aiorf.metrics import timed
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+content_types = {
+    'application/x-ndjson': NDJSON,
+    'application/jsonlines': NDJSON,
+    'text/csv': CSV,
+}
+
+
+def get_import_format(request):
+    fmt = content_types.get(request.content_type)
+    if fmt is None:
+        raise UnsupportedMediaType(available=sorted(content_types))
+    return fmt
+
+
+async def iter_lines(content, encoding='utf-8'):
+    """
+    Decoded lines of a request body, read a chunk at a time.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    async for chunk in content.iter_any():
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+async def iter_ndjson(lines):
+    async for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+
+async def iter_csv(lines):
+    """
+    Rows of a CSV body with a header line. Empty values are null, as in
+    Postgres' own CSV format.
+    """
+    header = None
+    record = []
+    async for line in lines:
+        record.append(line)
+        # A quoted value runs over lines until its quotes are balanced
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        text, record = '\n'.join(record), []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = values
+        elif len(values) != len(header):
+            yield ValueError('Expected {} values, got {}'.format(len(header), len(values)))
+        else:
+            yield {name: value if value != '' else None for name, value in zip(header, values)}
+    if record:
+        yield ValueError('Unterminated quoted value')
+
+
+readers = {
+    NDJSON: iter_ndjson,
+    CSV: iter_csv,
+}
+
+
+class ImportResult:
+    """
+    Counts of an import and the first `max_errors` row errors. Rows are
+    numbered from 1, without the CSV header.
+    """
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {'rows': self.rows, 'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def load_rows(schema, rows, first, result):
+    """
+    Deserialize `rows` with `schema`, without its `post_load` hooks.
+    Returns the valid rows and records the others in `result`.
+    """
+    parsed = []
+    errors = []
+    for row, item in enumerate(rows, first):
+        if isinstance(item, Exception):
+            errors.append((row, {'_schema': [str(item)]}))
+        else:
+            parsed.append((row, item))
+    loaded = []
+    if parsed:
+        try:
+            # What `Schema.validate` runs, keeping the deserialized values
+            loaded = schema._do_load([item for _, item in parsed], many=True, postprocess=False)
+        except ValidationError as e:
+            for index, ((row, _), item) in enumerate(zip(parsed, e.valid_data)):
+                if index in e.messages:
+                    errors.append((row, e.messages[index]))
+                else:
+                    loaded.append(item)
+    for row, messages in sorted(errors, key=lambda error: error[0]):
+        result.add_error(row, messages)
+    return loaded
+
+
+async def load_batches(request, fmt, schema, batch_size, result, error_limit=None):
+    """
+    Yield lists of up to `batch_size` valid rows of a streamed body in
+    `fmt`, deserialized by `schema`. Invalid rows are recorded in
+    `result`; past `error_limit` of them the import fails with 400.
+    """
+    records = readers[fmt](iter_lines(request.content, request.charset or 'utf-8'))
+    batch = []
+    async for record in records:
+        batch.append(record)
+        if len(batch) < batch_size:
+            continue
+        yield _load_batch(schema, batch, result, error_limit)
+        batch = []
+    if batch:
+        yield _load_batch(schema, batch, result, error_limit)
+
+
+def _load_batch(schema, batch, result, error_limit):
+    with timed('load'):
+        first = result.rows + 1
+        result.rows += len(batch)
+        loaded = load_rows(schema, batch, first, result)
+    if error_limit is not None and result.failed > error_limit:
+        raise BadRequest('Too many invalid rows, nothing was imported', **result.as_dict())
+    return loaded
+
+
+def group_columns(rows):
+    """
+    `(columns, records)` of the rows sharing each set of keys, records
+    being tuples in the order of `columns`.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(tuple(row.values()))
+    return list(groups.items())
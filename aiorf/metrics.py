@@ -0,0 +1,166 @@
+import bisect
+import contextvars
+import time
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_timings = contextvars.ContextVar('aiorf_timings', default=None)
+
+
+class Timings:
+    """
+    Seconds spent per stage of one request.
+    """
+    __slots__ = ('stages', 'active', 'started')
+
+    def __init__(self):
+        self.stages = {}
+        self.active = set()
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self):
+        self.stages['total'] = time.perf_counter() - self.started
+
+    def header(self):
+        """
+        The stages as a `Server-Timing` header value, in milliseconds.
+        """
+        return ', '.join('{};dur={:.2f}'.format(stage, seconds * 1000) for stage, seconds in self.stages.items())
+
+
+def start_timings():
+    """
+    Collect the timings of the current task, returns them and a token for
+    `stop_timings`.
+    """
+    timings = Timings()
+    return timings, _timings.set(timings)
+
+
+def stop_timings(token):
+    _timings.reset(token)
+
+
+class timed:
+    """
+    Add the time spent in the block to `stage` of the current request.
+
+    A no-op outside requests. Nested blocks of the same stage, a nested
+    schema dumping inside another, count once.
+    """
+    __slots__ = ('stage', 'timings', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.timings = None
+
+    def __enter__(self):
+        timings = _timings.get()
+        if timings is not None and self.stage not in timings.active:
+            timings.active.add(self.stage)
+            self.timings = timings
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.stage, time.perf_counter() - self.started)
+            self.timings.active.discard(self.stage)
+            self.timings = None
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            # Per bucket counts, the last one for +Inf, then sum
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(self.labelnames, labels, [('le', bound)]), cumulative))
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append('{}_sum{} {}'.format(self.name, label_text, series[-1]))
+            lines.append('{}_count{} {}'.format(self.name, label_text, cumulative))
+        return lines
+
+
+class Metrics:
+    """
+    Request stage histograms per endpoint, method and response status,
+    and gauges of the connections in use and waited for per pool, in the
+    Prometheus text format.
+
+    Stages are `queue` (waiting for admission), `acquire` (waiting for a
+    pool connection), `db`, `load` (validating imported rows), `dump`,
+    `render`, `compress` and `total`.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.stages = Histogram('aiorf_stage_seconds', 'Time spent per request stage.',
+                                ('endpoint', 'method', 'status', 'stage'), buckets)
+        self.pools = {}
+
+    def observe(self, endpoint, method, status, timings):
+        for stage, seconds in timings.stages.items():
+            self.stages.observe((endpoint, method, status, stage), seconds)
+
+    def register_pool(self, backend, name):
+        """
+        Export the `in_use` and `waiting` counts of a backend under `name`.
+        """
+        for registered in self.pools.values():
+            if registered is backend:
+                return
+        label, index = name, 1
+        while label in self.pools:
+            label, index = '{}{}'.format(name, index), index + 1
+        self.pools[label] = backend
+
+    def collect(self):
+        lines = self.stages.collect()
+        for name, attribute, documentation in (
+                ('aiorf_pool_connections_in_use', 'in_use', 'Connections acquired from the pool.'),
+                ('aiorf_pool_connections_waiting', 'waiting', 'Requests waiting for a pool connection.')):
+            lines.append('# HELP {} {}'.format(name, documentation))
+            lines.append('# TYPE {} gauge'.format(name))
+            for label, backend in self.pools.items():
+                lines.append('{}{{pool="{}"}} {}'.format(name, label, getattr(backend, attribute)))
+        return '\n'.join(lines) + '\n'
+
+    async def handler(self, request):
+        response = web.Response(text=self.collect())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return response
+
+    def setup_routes(self, router, path='/metrics'):
+        router.add_route('GET', path, self.handler)
+
+
+default_metrics = Metrics()
@@ -1,44 +1,168 @@
 import peewee_async
 from aiohttp import web
+from marshmallow import ValidationError
+
+from aiorf.conditional import conditional_response, get_validators, make_etag
+from aiorf.exceptions import BadRequest
+from aiorf.imports import ImportResult, get_import_format, load_batches
+from aiorf.metrics import timed
+from aiorf.streaming import iter_peewee_cursor, get_stream_format, stream_response
+
+
+async def perform_bulk(view, query):
+    """
+    Run an UPDATE or DELETE query in a transaction and return the number of
+    affected rows, rolling back if it exceeds `view.bulk_max_rows`.
+    """
+    async with view.manager.atomic():
+        affected = await view.manager.execute(query)
+        if view.bulk_max_rows is not None and affected > view.bulk_max_rows:
+            raise BadRequest('Too many rows affected', affected=affected, limit=view.bulk_max_rows)
+    await view.invalidate_object()
+    return affected
+
+
+def filter_bulk_queryset(view, action):
+    """
+    The queryset of a bulk update or delete, narrowed by the view's filter
+    backends. Fails with 400 unless one of them added a WHERE clause, so
+    parameters nothing filters on can't write every row.
+    """
+    if not view.request.query:
+        raise BadRequest('Bulk {} requires a filter'.format(action))
+    queryset = view.get_queryset()
+    filtered = view.filter_queryset(queryset)
+    if filtered._where is None or filtered._where is queryset._where:
+        raise BadRequest('Bulk {} requires a filter'.format(action), parameters=sorted(view.request.query))
+    return filtered
 
 
 class CreateModelMixin:
     """
     Create a model instance.
     """
+    bulk_batch_size = 1000
+
     async def create(self):
         serializer = self.get_serializer()
-        data = await request.json()
-        obj = serializer.load(data)
-        await self.perform_create(obj)
-        headers = self.get_success_headers(serializer.data)
-        return web.json_response(serializer.data, status=web.HTTPCreated.status_code, headers=headers)
+        data = await self.request.json()
+        if isinstance(data, list):
+            return await self.bulk_create(serializer, data)
+        try:
+            obj = serializer.load(data)
+        except ValidationError as e:
+            raise BadRequest(e.messages)
+        obj = await self.perform_create(obj)
+        obj = (await self.prefetch_related(serializer, [obj]))[0]
+        data = serializer.dump(obj)
+        headers = self.get_success_headers(data)
+        return self.render(data, status=web.HTTPCreated.status_code, headers=headers)
 
     async def perform_create(self, obj):
-        await self.manager.create(obj)
+        return await self.manager.create(type(obj), **obj._data)
+
+    async def bulk_create(self, serializer, data):
+        """
+        Insert a list of objects with multi-row `INSERT ... RETURNING`
+        statements of up to `bulk_batch_size` rows, all in one transaction.
+        Nothing is inserted if any item fails validation.
+        """
+        errors = serializer.validate(data, many=True)
+        if errors:
+            raise BadRequest('Invalid items', items=errors)
+        created = await self.perform_bulk_create(data)
+        created = await self.prefetch_related(serializer, created)
+        return self.render(serializer.dump(created, many=True), status=web.HTTPCreated.status_code)
+
+    async def perform_bulk_create(self, data):
+        model = self.get_serializer_class().Meta.model
+        created = []
+        async with self.manager.atomic():
+            for start in range(0, len(data), self.bulk_batch_size):
+                # peewee_async only reads back ids of multi-row inserts,
+                # so the statement runs as a raw query to get whole rows
+                # Instances map attributes like foreign key ids to field names
+                rows = [model(**item)._data for item in data[start:start + self.bulk_batch_size]]
+                sql, params = model.insert_many(rows).returning().sql()
+                created.extend(await peewee_async.execute(model.raw(sql, *params)))
+        return created
 
     def get_success_headers(self, data):
         return {}
 
 
+class ImportModelMixin:
+    """
+    Import model instances from a streamed NDJSON or CSV body.
+    """
+    import_batch_size = 5000
+    import_max_errors = 100
+    import_error_limit = None
+
+    async def bulk_import(self):
+        """
+        Rows are validated `import_batch_size` at a time and inserted with
+        multi-row `INSERT`s in one transaction, so either every valid row
+        is imported or none is. Invalid rows are skipped and reported, the
+        first `import_max_errors` of them; past `import_error_limit` the
+        import fails.
+        """
+        fmt = get_import_format(self.request)
+        result = ImportResult(self.import_max_errors)
+        batches = load_batches(self.request, fmt, self.get_serializer(), self.import_batch_size, result,
+                               self.import_error_limit)
+        async with self.manager.atomic():
+            async for rows in batches:
+                result.imported += await self.perform_import(rows)
+        return self.render(result.as_dict())
+
+    async def perform_import(self, rows):
+        model = self.get_serializer_class().Meta.model
+        groups = {}
+        for row in rows:
+            # Instances map attributes like foreign key ids to field names
+            data = model(**row)._data
+            # Multi-row inserts need the same fields in every row
+            groups.setdefault(tuple(data), []).append(data)
+        for group in groups.values():
+            await self.manager.execute(model.insert_many(group))
+        return len(rows)
+
+
 class ListModelMixin:
     """
     List a queryset.
     """
+    stream = False
+    stream_format = 'json'
+    stream_batch_size = 1000
+
     async def list(self):
-        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_fieldset_serializer()
+        queryset = self.select_fields(self.filter_queryset(self.get_queryset()), serializer)
+
+        if self.stream:
+            return await stream_response(
+                self.request,
+                self.iter_related(serializer, iter_peewee_cursor(self.read_manager, queryset, self.stream_batch_size)),
+                lambda recs: serializer.dump(recs, many=True),
+                fmt=get_stream_format(self.request, self.stream_format))
 
         page = self.paginate_queryset(queryset)
 
         if page is not None:
-            page = await peewee_async.execute(page)
-            serializer = self.get_serializer()
-            serializer.dump(page, many=True)
-            return self.get_paginated_response(serializer)
+            if self.paginator.count:
+                self.paginator.set_count(await self.count_strategy.count_queryset(queryset, self))
+            with timed('db'):
+                page = await self.read_manager.execute(page)
+            page = self.paginator.paginate_rows(page)
+            page = await self.prefetch_related(serializer, page)
+            return self.get_paginated_response(serializer.dump(page, many=True))
 
-        queryset = await peewee_async.execute(queryset)
-        serializer = self.get_serializer()
-        return web.json_response(serializer.dump(queryset, many=True))
+        with timed('db'):
+            queryset = await self.read_manager.execute(queryset)
+        queryset = await self.prefetch_related(serializer, queryset)
+        return self.render(serializer.dump(queryset, many=True))
 
 
 class RetrieveModelMixin:
@@ -46,31 +170,63 @@ class RetrieveModelMixin:
     Retrieve a model instance.
     """
     async def retrieve(self):
-        instance = await self.get_object()
-        serializer = self.get_serializer()
-        return web.json_response(serializer.dump(instance))
+        serializer = self.get_fieldset_serializer()
+        instance = await self.get_object(queryset=self.select_fields(self.get_queryset(), serializer))
+        instance = (await self.prefetch_related(serializer, [instance]))[0]
+        etag, last_modified = get_validators(instance, self.etag_field, self.last_modified_field)
+        fieldset = self.get_fieldset()
+        if etag is not None and fieldset != (None, None):
+            # Every fieldset is a representation of its own
+            etag = make_etag(etag, fieldset)
+        return conditional_response(self.request, lambda: serializer.dump(instance), etag, last_modified,
+                                    renderer=self.get_renderer())
 
 
 class UpdateModelMixin:
     """
     Update a model instance.
     """
-    async def update(self):
-        partial = kwargs.pop('partial', False)
-        instance = await self.get_object()
+    async def update(self, partial=False):
         serializer = self.get_serializer()
-        data = await request.json()
-        obj = serializer.load(data, instance=instance)
-        await self.perform_update(obj)
+        data = await self.request.json()
+        async with self.manager.atomic():
+            # Writes start from the stored object, not from a cached copy
+            instance = await self.get_write_object()
+            try:
+                obj = serializer.load(data, instance=instance, partial=partial)
+            except ValidationError as e:
+                raise BadRequest(e.messages)
+            await self.perform_update(obj)
+        # Once committed, or a cache fill could read the old row back
+        await self.invalidate_object(obj)
+        obj = (await self.prefetch_related(serializer, [obj]))[0]
 
-        return web.json_response(obj._data)
+        return self.render(serializer.dump(obj))
 
     async def perform_update(self, obj):
         await self.manager.update(obj)
 
     async def partial_update(self):
-        kwargs['partial'] = True
-        return await self.update(request, *args, **kwargs)
+        return await self.update(partial=True)
+
+    async def bulk_update(self):
+        """
+        Update every object of the filtered queryset with one statement.
+        """
+        queryset = filter_bulk_queryset(self, 'update')
+        serializer = self.get_serializer()
+        data = await self.request.json()
+        errors = serializer.validate(data, partial=True)
+        if errors:
+            raise BadRequest(errors)
+        affected = await self.perform_bulk_update(queryset, data)
+        return self.render({'affected': affected})
+
+    async def perform_bulk_update(self, queryset, data):
+        model = queryset.model_class
+        pk = model._meta.primary_key
+        query = model.update(**data).where(pk << queryset.select(pk))
+        return await perform_bulk(self, query)
 
 
 class DestroyModelMixin:
@@ -78,10 +234,25 @@ class DestroyModelMixin:
     Destroy a model instance.
     """
     async def destroy(self):
-        instance = await self.get_object()
-
-        await self.perform_destroy(instance)
+        async with self.manager.atomic():
+            instance = await self.get_write_object()
+            await self.perform_destroy(instance)
+        await self.invalidate_object(instance)
         return web.json_response(status=web.HTTPNoContent.status_code)
 
     async def perform_destroy(self, instance):
         await self.manager.delete(instance)
+
+    async def bulk_destroy(self):
+        """
+        Delete every object of the filtered queryset with one statement.
+        """
+        queryset = filter_bulk_queryset(self, 'delete')
+        affected = await self.perform_bulk_destroy(queryset)
+        return self.render({'affected': affected})
+
+    async def perform_bulk_destroy(self, queryset):
+        model = queryset.model_class
+        pk = model._meta.primary_key
+        query = model.delete().where(pk << queryset.select(pk))
+        return await perform_bulk(self, query)
@@ -1,7 +1,13 @@
+import functools
+
 import peewee
-from marshmallow import Schema, validate, post_load, fields, pre_dump
+from marshmallow import Schema, validate, post_load, fields, pre_dump, missing
 from marshmallow.schema import SchemaMeta
 
+from aiorf.codegen import compile_dump, get_compiled_dump
+from aiorf.metrics import timed
+from aiorf.relations import ForeignKey
+
 
 translation_table = {
     peewee.IntegerField: fields.Int,
@@ -18,33 +24,120 @@ translation_table = {
 }
 
 
+def object_id_name(field):
+    """
+    Attribute of a foreign key's raw value, which unlike the field itself
+    doesn't fetch the related instance.
+    """
+    if field.object_id_name:
+        return field.object_id_name
+    if field.db_column == field.name:
+        return field.db_column + '_id'
+    return field.db_column
+
+
+@functools.lru_cache(maxsize=None)
+def get_field_class(model_field_class):
+    """
+    The marshmallow field class for a peewee field class, resolved once per
+    class with the precedence of `translation_table`.
+    """
+    for dbtype, schematype in translation_table.items():
+        if issubclass(model_field_class, dbtype):
+            return schematype
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def make_field(schematype, dump_only=False, attribute=None, max_length=missing, allow_none=False, default=None):
+    """
+    A generated field. Fields without a default are shared by all the
+    schema classes generating the same one, schema instances work on
+    copies of them.
+    """
+    params = {'dump_only': dump_only, 'allow_none': allow_none, 'default': default}
+    if attribute is not None:
+        params['attribute'] = attribute
+    if max_length is not missing:
+        params['validate'] = validate.Length(max=max_length)
+    return schematype(**params)
+
+
 class ModelSchemaMeta(SchemaMeta):
+    """
+    Fields of `Meta.model` are generated on first use of a schema class
+    rather than when it's defined, which keeps importing hundreds of
+    schemas cheap. Read `_declared_fields` of a class after
+    `resolve_fields()`; instances and subclasses resolve their class.
+    """
     def __new__(cls, clsname, superclasses, attributedict):
+        for base in superclasses:
+            if isinstance(base, ModelSchemaMeta):
+                base.resolve_fields()
         if 'Meta' not in attributedict:
             return super().__new__(cls, clsname, superclasses, attributedict)
-        model_fields = {}
         if not attributedict['Meta'].model:
             raise AssertionError('Meta.model is required')
-        for name, field in attributedict['Meta'].model._meta.fields.items():
-            for dbtype, schematype in translation_table.items():
-                if not hasattr(attributedict['Meta'], 'fields') or name in attributedict['Meta'].fields:
-                    if isinstance(field, dbtype):
-                        params = {}
-                        if isinstance(field, peewee.PrimaryKeyField):
-                            params['dump_only'] = True
-                        if hasattr(field, 'max_length'):
-                            params['validate'] = validate.Length(max=field.max_length)
-                        params['allow_none'] = field.null
-                        params['default'] = field.default
-                        model_fields[name] = schematype(**params)
-                        break
-        new_attributedict = {}
-        new_attributedict.update(model_fields)
-        new_attributedict.update(attributedict)
-        return super().__new__(cls, clsname, superclasses, new_attributedict)
+        for name, field in attributedict.items():
+            if isinstance(field, ForeignKey):
+                field.column = field.column or name
+                model_field = attributedict['Meta'].model._meta.fields.get(field.column)
+                if not isinstance(model_field, peewee.ForeignKeyField):
+                    raise AssertionError('{} is not a foreign key'.format(field.column))
+        own_fields = [name for name, value in attributedict.items() if isinstance(value, fields.Field)]
+        klass = super().__new__(cls, clsname, superclasses, attributedict)
+        klass._own_fields = own_fields
+        klass._fields_resolved = False
+        return klass
+
+    def get_model_fields(cls):
+        model_fields = {}
+        for name, field in cls.Meta.model._meta.fields.items():
+            if hasattr(cls.Meta, 'fields') and name not in cls.Meta.fields:
+                continue
+            schematype = get_field_class(type(field))
+            if schematype is None:
+                continue
+            params = {}
+            if isinstance(field, peewee.PrimaryKeyField):
+                params['dump_only'] = True
+            if isinstance(field, peewee.ForeignKeyField):
+                params['attribute'] = object_id_name(field)
+            if hasattr(field, 'max_length'):
+                params['max_length'] = field.max_length
+            params['allow_none'] = field.null
+            if field.default is None:
+                model_fields[name] = make_field(schematype, **params)
+            else:
+                model_fields[name] = make_field.__wrapped__(schematype, default=field.default, **params)
+        return model_fields
+
+    def resolve_fields(cls):
+        """
+        Generate the model fields into `_declared_fields`, once per class.
+        Fields declared on the class override generated ones.
+        """
+        if cls.__dict__.get('_fields_resolved', True):
+            return
+        declared = cls._declared_fields
+        generated = cls.get_model_fields()
+        generated.update((name, declared[name]) for name in cls._own_fields)
+        inherited = [(name, field) for name, field in declared.items() if name not in generated]
+        cls._declared_fields = type(declared)(inherited + list(generated.items()))
+        cls._fields_resolved = True
+        if getattr(cls.Meta, 'compiled', False):
+            dump = compile_dump(cls)
+            if dump is not None:
+                cls._compiled_dump = staticmethod(dump)
 
 
 class ModelSchema(Schema, metaclass=ModelSchemaMeta):
+    _compiled_dump = None
+
+    def __init__(self, *args, **kwargs):
+        type(self).resolve_fields()
+        super().__init__(*args, **kwargs)
+
     @post_load(pass_many=True)
     def make_object(self, data, many, **kwargs):
         if not data:
@@ -58,17 +151,13 @@ class ModelSchema(Schema, metaclass=ModelSchemaMeta):
 
     def load(self, data, *, instance=None, **kwargs):
         self._instance = instance
-        super().load(data, **kwargs)
-
-#     @pre_dump
-#     def dump_relations(self, data, pass_many=False):
-#         for k, v in self.declared_fields.items():
-#             if isinstance(v, ForeignKey):
-#
-#
-#
-#
-# class ForeignKey(fields.Nested):
-#     def __init__(self, nested, field_name, **kwargs):
-#         super().__init__(nested, **kwargs)
-#         self.field_name = field_name
+        return super().load(data, **kwargs)
+
+    def _serialize(self, obj, *, many=False):
+        with timed('dump'):
+            dump = get_compiled_dump(self)
+            if dump is None or obj is None:
+                return super()._serialize(obj, many=many)
+            if many:
+                return dump(obj, self.dump_fields, self.get_attribute)
+            return dump((obj,), self.dump_fields, self.get_attribute)[0]
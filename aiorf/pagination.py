@@ -0,0 +1,188 @@
+import base64
+import binascii
+import json
+
+import peewee
+import sqlalchemy as sa
+from marshmallow.utils import get_value
+
+from aiorf.counting import count_headers
+from aiorf.exceptions import BadRequest
+from aiorf.renderers import default_renderer, render_response
+
+
+class KeysetPagination:
+    """
+    Cursor pagination over a sort key plus the primary key.
+
+    Pages are selected with `WHERE (key, pk) > (...) LIMIT n` instead of
+    OFFSET, so page 10000 costs the same as page 1. Cursors are opaque
+    tokens holding the position of the first or last row of a page.
+    Counting is left out unless `count` is set.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering = None
+    count = False
+
+    def __init__(self):
+        self.request = None
+        self.position = None
+        self.reverse = False
+        self.limit = self.page_size
+        self.total = None
+        self.next_position = None
+        self.previous_position = None
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps([position, reverse], default=str).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            position, reverse = json.loads(data.decode('utf-8'))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise BadRequest('Invalid cursor')
+        if not isinstance(position, list):
+            raise BadRequest('Invalid cursor')
+        return position, bool(reverse)
+
+    def get_page_size(self, request):
+        value = request.query.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            size = int(value)
+        except ValueError:
+            raise BadRequest('Invalid {}'.format(self.page_size_query_param))
+        if size < 1:
+            raise BadRequest('Invalid {}'.format(self.page_size_query_param))
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, view, pk_name):
+        """
+        Names of the keyset columns and whether they are sorted descending.
+        """
+        ordering = self.ordering or getattr(view, 'ordering', None) or pk_name
+        descending = ordering.startswith('-')
+        key = ordering.lstrip('-')
+        names = [key] if key == pk_name else [key, pk_name]
+        return names, descending
+
+    def _setup(self, request, view, pk_name):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        token = request.query.get(self.cursor_query_param)
+        if token:
+            self.position, self.reverse = self.decode_cursor(token)
+        self.names, descending = self.get_ordering(view, pk_name)
+        if self.position is not None and len(self.position) != len(self.names):
+            raise BadRequest('Invalid cursor')
+        # Walking backwards flips the direction of both the filter and the sort
+        self.ascending = descending == self.reverse
+
+    def paginate_query(self, query, request, view):
+        """
+        Narrow an SQLAlchemy select of `view.model` down to one page.
+        """
+        table = view.model.__table__
+        pk_name = list(table.primary_key.columns)[0].name
+        self._setup(request, view, pk_name)
+        columns = [table.c[name] for name in self.names]
+        if self.position is not None:
+            key = sa.tuple_(*columns)
+            value = sa.tuple_(*[sa.literal(v, type_=c.type) for c, v in zip(columns, self.position)])
+            query = query.where(key > value if self.ascending else key < value)
+        order = sa.asc if self.ascending else sa.desc
+        return query.order_by(*[order(column) for column in columns]).limit(self.limit + 1)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Narrow a peewee select query down to one page.
+        """
+        model = queryset.model_class
+        pk_name = model._meta.primary_key.name
+        self._setup(request, view, pk_name)
+        fields = [getattr(model, name) for name in self.names]
+        if self.position is not None:
+            key, value = peewee.Tuple(*fields), peewee.Tuple(*self.position)
+            queryset = queryset.where(key > value if self.ascending else key < value)
+        order = [field.asc() if self.ascending else field.desc() for field in fields]
+        return queryset.order_by(*order).limit(self.limit + 1)
+
+    def paginate_rows(self, rows):
+        """
+        Trim the lookahead row off a fetched page and work out its neighbours.
+        """
+        rows = list(rows)
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.reverse:
+            rows.reverse()
+        first = self._get_position(rows[0]) if rows else self.position
+        last = self._get_position(rows[-1]) if rows else self.position
+
+        if self.reverse:
+            self.next_position = last
+            self.previous_position = first if has_more else None
+        else:
+            self.next_position = last if has_more else None
+            self.previous_position = first if self.position is not None else None
+        return rows
+
+    def _get_position(self, row):
+        return [get_value(row, name) for name in self.names]
+
+    def set_count(self, total):
+        """
+        Remember the `counting.Total` of the unpaginated query.
+        """
+        self.total = total
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        token = self.encode_cursor(position, reverse)
+        return str(self.request.url.update_query({self.cursor_query_param: token}))
+
+    def get_next_link(self):
+        return self.get_link(self.next_position, False)
+
+    def get_previous_link(self):
+        return self.get_link(self.previous_position, True)
+
+    def get_headers(self):
+        """
+        Page links as a `Link` header, for endpoints that return bare lists.
+        """
+        links = []
+        for rel, link in (('next', self.get_next_link()), ('prev', self.get_previous_link())):
+            if link is not None:
+                links.append('<{}>; rel="{}"'.format(link, rel))
+        headers = {}
+        if links:
+            headers['Link'] = ', '.join(links)
+        if self.total is not None:
+            headers.update(count_headers(self.total))
+        return headers
+
+    def get_paginated_response(self, data, renderer=default_renderer):
+        """
+        The page wrapped with its links, or for tabular renderers the bare
+        rows with the links in headers.
+        """
+        if renderer.tabular:
+            return render_response(renderer, data, headers=self.get_headers())
+        body = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        headers = {}
+        if self.total is not None:
+            body['count'] = self.total.value
+            headers.update(count_headers(self.total))
+        return render_response(renderer, body, headers=headers)
@@ -0,0 +1,88 @@
+from marshmallow import fields
+
+
+class ForeignKey(fields.Nested):
+    """
+    A related object dumped with the `nested` schema.
+
+    Related objects aren't fetched while dumping: `load_related` and
+    `prefetch_related` fetch them for a whole page of rows beforehand,
+    with one `IN` query per relation instead of one query per row.
+    `column` names what holds the key, the model schemas fill it in:
+    `<name>_id` for tables, the foreign key field for peewee models.
+    """
+    def __init__(self, nested, column=None, **kwargs):
+        super().__init__(nested, **kwargs)
+        self.column = column
+
+
+def get_relations(schema):
+    """
+    `(name, field)` of the `ForeignKey` fields `schema` dumps.
+    """
+    return [(name, field) for name, field in schema.dump_fields.items()
+            if isinstance(field, ForeignKey)]
+
+
+async def load_related(conn, table, schema, rows):
+    """
+    Rows of `table` as dicts with the related rows of every `ForeignKey`
+    field of `schema` stitched in, nested relations included. Runs one
+    query per relation through a backend connection.
+    """
+    relations = get_relations(schema)
+    if not relations:
+        return rows
+    rows = [dict(row) for row in rows]
+    for name, field in relations:
+        column = field.column or '{}_id'.format(name)
+        target = next(iter(table.c[column].foreign_keys)).column
+        keys = {row[column] for row in rows if row.get(column) is not None}
+        related = {}
+        if keys:
+            fetched = await conn.fetch(target.table.select().where(target.in_(list(keys))))
+            fetched = await load_related(conn, target.table, field.schema, fetched)
+            related = {row[target.name]: row for row in fetched}
+        for row in rows:
+            row[name] = related.get(row.get(column))
+    return rows
+
+
+def _get_key(obj, foreign_key):
+    if isinstance(obj, dict):
+        return obj.get(foreign_key.db_column)
+    return obj._data.get(foreign_key.name)
+
+
+def _set_related(obj, name, value):
+    if isinstance(obj, dict):
+        obj[name] = value
+    else:
+        # Straight into the descriptor's cache, so the instance isn't dirtied
+        obj._obj_cache[name] = value
+
+
+async def prefetch_related(manager, model, schema, objs):
+    """
+    Attach the related instances of every `ForeignKey` field of `schema`
+    to peewee instances (or row dicts) of `model`, nested relations
+    included. Runs one query per relation.
+    """
+    relations = get_relations(schema)
+    if not relations:
+        return objs
+    objs = list(objs)
+    for name, field in relations:
+        foreign_key = model._meta.fields[field.column or name]
+        to_field = foreign_key.to_field
+        keys = {_get_key(obj, foreign_key) for obj in objs}
+        keys.discard(None)
+        related = {}
+        if keys:
+            fetched = list(await manager.execute(
+                foreign_key.rel_model.select().where(to_field << list(keys))))
+            fetched = await prefetch_related(manager, foreign_key.rel_model, field.schema, fetched)
+            related = {getattr(obj, to_field.name): obj for obj in fetched}
+        for obj in objs:
+            _set_related(obj, name, related.get(_get_key(obj, foreign_key)))
+    return objs
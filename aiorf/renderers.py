@@ -0,0 +1,121 @@
+import datetime
+import decimal
+import json
+import uuid
+
+import mimeparse
+from aiohttp import web
+
+from aiorf.exceptions import NotAcceptable
+from aiorf.metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+class BaseRenderer:
+    """
+    Encode dumped data into a response body.
+
+    `tabular` renderers take lists of flat rows, paginated responses put
+    their links in headers for them. Renderers whose library isn't
+    installed are not `available` and are left out of negotiation.
+    """
+    media_type = None
+    tabular = False
+    available = True
+
+    def render(self, data):
+        raise NotImplementedError
+
+
+def json_default(value):
+    """
+    JSON of the values rows hold that JSON has no type for: ISO 8601
+    dates and times, and decimals and UUIDs as strings.
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class JSONRenderer(BaseRenderer):
+    """
+    Compact JSON, encoded by orjson when installed.
+    """
+    media_type = 'application/json'
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=json_default)
+
+    def render(self, data):
+        if orjson is not None:
+            return orjson.dumps(data, default=json_default)
+        return self.encoder.encode(data).encode('utf-8')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    available = msgpack is not None
+
+    def render(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+
+class ArrowRenderer(BaseRenderer):
+    """
+    Arrow IPC stream of a list of rows, one column per field.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    tabular = True
+    available = pyarrow is not None
+
+    def render(self, data):
+        rows = [data] if isinstance(data, dict) else data
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        table = pyarrow.Table.from_pydict({name: [row.get(name) for row in rows] for name in names})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+default_renderer = JSONRenderer()
+
+
+def select_renderer(request, renderers):
+    """
+    The renderer best matching the `Accept` header, the first one without
+    the header. Fails with 406 when none matches.
+    """
+    accept = request.headers.get('Accept')
+    if not accept:
+        return renderers[0]
+    media_types = [renderer.media_type for renderer in renderers]
+    # best_match prefers the last of equally good types
+    match = mimeparse.best_match(media_types[::-1], accept)
+    if not match:
+        raise NotAcceptable(available=media_types)
+    return renderers[media_types.index(match)]
+
+
+def render_response(renderer, data, status=200, headers=None):
+    with timed('render'):
+        body = renderer.render(data)
+    response = web.Response(body=body, status=status,
+                            content_type=renderer.media_type, headers=headers)
+    response.headers['Vary'] = 'Accept'
+    return response
@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import logging
+import math
+import time
+
+from aiorf.backends import Backend, get_backend
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+STICKY_COOKIE = 'aiorf_primary_until'
+STICKY_HEADER = 'X-Primary-Until'
+
+# Replay lag in seconds, 0 while the replica has replayed all it received
+LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+_use_primary = contextvars.ContextVar('aiorf_use_primary', default=True)
+
+
+def use_primary(value):
+    """
+    Route the reads of the current task to the primary or to replicas.
+    Returns a token for `reset_primary`.
+    """
+    return _use_primary.set(value)
+
+
+def reset_primary(token):
+    _use_primary.reset(token)
+
+
+def is_sticky(request):
+    """
+    Whether the client wrote recently enough to have to read its writes
+    from the primary, by the token in the cookie or header.
+    """
+    token = request.headers.get(STICKY_HEADER) or request.cookies.get(STICKY_COOKIE)
+    if not token:
+        return False
+    try:
+        return float(token) > time.time()
+    except ValueError:
+        return False
+
+
+def reads_from_primary(request):
+    return request.method not in SAFE_METHODS or is_sticky(request)
+
+
+def set_sticky(response, seconds):
+    """
+    Keep the client's reads on the primary for `seconds` after a write.
+    """
+    token = '{:.3f}'.format(time.time() + seconds)
+    response.set_cookie(STICKY_COOKIE, token, max_age=math.ceil(seconds), httponly=True)
+    response.headers[STICKY_HEADER] = token
+
+
+class ReplicaRouter:
+    """
+    Balance reads over replicas by least outstanding requests.
+
+    `check_lag(replica)` returns the replication lag of a replica in
+    seconds. The monitor started by `start()` runs it every
+    `check_interval` seconds, and replicas lagging more than `max_lag`, or
+    failing the check, leave the rotation until they catch up.
+    """
+    max_lag = 10.0
+    check_interval = 5.0
+
+    def __init__(self, replicas, check_lag, max_lag=None, check_interval=None):
+        self.replicas = list(replicas)
+        self.check_lag = check_lag
+        if max_lag is not None:
+            self.max_lag = max_lag
+        if check_interval is not None:
+            self.check_interval = check_interval
+        self.outstanding = [0] * len(self.replicas)
+        self.lag = [None] * len(self.replicas)
+        self.healthy = [True] * len(self.replicas)
+        self._task = None
+
+    def pick(self):
+        """
+        Index of the healthy replica with the fewest outstanding requests,
+        `None` when there's none.
+        """
+        candidates = [index for index, healthy in enumerate(self.healthy) if healthy]
+        if not candidates:
+            return None
+        return min(candidates, key=self.outstanding.__getitem__)
+
+    def acquire(self, index):
+        self.outstanding[index] += 1
+
+    def release(self, index):
+        self.outstanding[index] -= 1
+
+    async def check(self):
+        for index, replica in enumerate(self.replicas):
+            try:
+                lag = await self.check_lag(replica)
+                lag = float(lag or 0)
+            except Exception:
+                logger.exception('Replica %d failed its lag check', index)
+                lag = None
+            healthy = lag is not None and lag <= self.max_lag
+            if healthy != self.healthy[index]:
+                if healthy:
+                    logger.info('Replica %d back in rotation', index)
+                else:
+                    logger.warning('Replica %d out of rotation, lag %s', index, lag)
+            self.lag[index] = lag
+            self.healthy[index] = healthy
+
+    async def monitor(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self._task is None and self.replicas:
+            self._task = asyncio.ensure_future(self.monitor())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return [
+            {'outstanding': outstanding, 'lag': lag, 'healthy': healthy}
+            for outstanding, lag, healthy in zip(self.outstanding, self.lag, self.healthy)
+        ]
+
+
+class _ReplicaAcquire:
+    def __init__(self, router, index):
+        self.router = router
+        self.index = index
+        self._context = None
+
+    async def __aenter__(self):
+        self.router.acquire(self.index)
+        try:
+            self._context = self.router.replicas[self.index].acquire()
+            return await self._context.__aenter__()
+        except BaseException:
+            self.router.release(self.index)
+            raise
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self._context.__aexit__(*exc_info)
+        finally:
+            self.router.release(self.index)
+
+
+class ReplicaSet(Backend):
+    """
+    A primary pool and replica pools behind one backend.
+
+    `acquire()` gives a replica connection when the current request was
+    routed to replicas with `use_primary(False)`, and a primary connection
+    otherwise, so code outside requests keeps reading from the primary.
+    """
+    def __init__(self, primary, replicas=(), max_lag=None, check_interval=None):
+        self.primary = get_backend(primary)
+        super().__init__(self.primary.pool)
+        self.router = ReplicaRouter([get_backend(replica) for replica in replicas], self.check_lag,
+                                    max_lag=max_lag, check_interval=check_interval)
+
+    @property
+    def dialect(self):
+        return self.primary.dialect
+
+    def get_pools(self):
+        return [('primary', self.primary)] + [('replica', replica) for replica in self.router.replicas]
+
+    async def check_lag(self, backend):
+        async with backend.acquire() as conn:
+            return await conn.fetchval(LAG_SQL)
+
+    def acquire(self):
+        if _use_primary.get():
+            return self.primary.acquire()
+        self.router.start()
+        index = self.router.pick()
+        if index is None:
+            return self.primary.acquire()
+        return _ReplicaAcquire(self.router, index)
+
+
+class ManagerReplicas:
+    """
+    Replica peewee_async managers for the generic views, with the same
+    balancing and lag monitoring as `ReplicaSet`.
+    """
+    def __init__(self, managers, max_lag=None, check_interval=None):
+        self.router = ReplicaRouter(managers, self.check_lag, max_lag=max_lag, check_interval=check_interval)
+
+    async def check_lag(self, manager):
+        cursor = await manager.database.cursor_async()
+        try:
+            await cursor.execute(LAG_SQL)
+            row = await cursor.fetchone()
+        finally:
+            await cursor.release
+        return row[0]
@@ -0,0 +1,24 @@
+class DefaultRouter:
+    """
+    Routes of many viewsets, under their prefixes:
+
+        router = DefaultRouter()
+        router.register('/users', UserViewSet)
+        router.register('/groups', GroupViewSet)
+        router.setup_routes(app.router)
+
+    Each viewset's routes and action handlers are built once, when it's
+    registered; requests only create the viewset instance.
+    """
+    def __init__(self):
+        self.registry = []
+
+    def register(self, prefix, viewset):
+        routes = viewset.get_routes(prefix.rstrip('/'))
+        self.registry.append((prefix, viewset, routes))
+
+    def get_routes(self):
+        return [route for prefix, viewset, routes in self.registry for route in routes]
+
+    def setup_routes(self, router):
+        router.add_routes(self.get_routes())
@@ -1,7 +1,13 @@
+import functools
+
 import sqlalchemy
-from marshmallow import Schema, validate, post_load, fields, pre_dump
+from marshmallow import Schema, validate, post_load, fields, pre_dump, missing
 from marshmallow.schema import SchemaMeta
 
+from aiorf.codegen import compile_dump, get_compiled_dump
+from aiorf.metrics import timed
+from aiorf.relations import ForeignKey
+
 translation_table = {
     sqlalchemy.types.Integer: fields.Int,
     sqlalchemy.types.Float: fields.Float,
@@ -15,33 +21,101 @@ translation_table = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def get_field_class(column_type_class):
+    """
+    The marshmallow field class for an SQLAlchemy type class, resolved
+    once per class with the precedence of `translation_table`.
+    """
+    for dbtype, schematype in translation_table.items():
+        if issubclass(column_type_class, dbtype):
+            return schematype
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def make_field(schematype, dump_only=False, length=missing, allow_none=False, default=None):
+    """
+    A generated field, shared like `aiorf.modelschema.make_field`.
+    """
+    params = {'dump_only': dump_only, 'allow_none': allow_none, 'default': default}
+    if length is not missing:
+        params['validate'] = validate.Length(max=length)
+    return schematype(**params)
+
+
 class ModelSchemaMeta(SchemaMeta):
+    """
+    Fields of `Meta.table` are generated on first use of a schema class,
+    see `aiorf.modelschema.ModelSchemaMeta`.
+    """
     def __new__(cls, clsname, superclasses, attributedict):
+        for base in superclasses:
+            if isinstance(base, ModelSchemaMeta):
+                base.resolve_fields()
         if 'Meta' not in attributedict:
             return super().__new__(cls, clsname, superclasses, attributedict)
-        model_fields = {}
-        if not attributedict['Meta'].table:
+        if attributedict['Meta'].table is None:
             raise AssertionError('Meta.table is required')
-        for name, column in attributedict['Meta'].table.columns.items():
-            for dbtype, schematype in translation_table.items():
-                if not hasattr(attributedict['Meta'], 'fields') or name in attributedict['Meta'].fields:
-                    if isinstance(column.type, dbtype):
-                        params = {}
-                        if column.primary_key:
-                            params['dump_only'] = True
-                        if hasattr(column.type, 'length'):
-                            params['validite'] = validate.Length(max=column.type.length)
-                        params['allow_none'] = column.nullable
-                        params['default'] = column.default
-                        model_fields[name] = schematype(**params)
-                        break
-        new_attributedict = {}
-        new_attributedict.update(model_fields)
-        new_attributedict.update(attributedict)
-        return super().__new__(cls, clsname, superclasses, new_attributedict)
+        for name, field in attributedict.items():
+            if isinstance(field, ForeignKey):
+                field.column = field.column or '{}_id'.format(name)
+                column = attributedict['Meta'].table.columns.get(field.column)
+                if column is None or not column.foreign_keys:
+                    raise AssertionError('{} is not a foreign key'.format(field.column))
+        own_fields = [name for name, value in attributedict.items() if isinstance(value, fields.Field)]
+        klass = super().__new__(cls, clsname, superclasses, attributedict)
+        klass._own_fields = own_fields
+        klass._fields_resolved = False
+        return klass
+
+    def get_model_fields(cls):
+        model_fields = {}
+        for name, column in cls.Meta.table.columns.items():
+            if hasattr(cls.Meta, 'fields') and name not in cls.Meta.fields:
+                continue
+            schematype = get_field_class(type(column.type))
+            if schematype is None:
+                continue
+            params = {}
+            if column.primary_key:
+                params['dump_only'] = True
+            if hasattr(column.type, 'length'):
+                params['length'] = column.type.length
+            params['allow_none'] = column.nullable
+            # Column names are `quoted_name`s, a str subclass orjson rejects as keys
+            if column.default is None:
+                model_fields[str(name)] = make_field(schematype, **params)
+            else:
+                model_fields[str(name)] = make_field.__wrapped__(schematype, default=column.default, **params)
+        return model_fields
+
+    def resolve_fields(cls):
+        """
+        Generate the table fields into `_declared_fields`, once per class.
+        Fields declared on the class override generated ones.
+        """
+        if cls.__dict__.get('_fields_resolved', True):
+            return
+        declared = cls._declared_fields
+        generated = cls.get_model_fields()
+        generated.update((name, declared[name]) for name in cls._own_fields)
+        inherited = [(name, field) for name, field in declared.items() if name not in generated]
+        cls._declared_fields = type(declared)(inherited + list(generated.items()))
+        cls._fields_resolved = True
+        if getattr(cls.Meta, 'compiled', False):
+            dump = compile_dump(cls)
+            if dump is not None:
+                cls._compiled_dump = staticmethod(dump)
 
 
 class ModelSchema(Schema, metaclass=ModelSchemaMeta):
+    _compiled_dump = None
+
+    def __init__(self, *args, **kwargs):
+        type(self).resolve_fields()
+        super().__init__(*args, **kwargs)
+
     @post_load(pass_many=True)
     def make_object(self, data, many, **kwargs):
         if not data:
@@ -57,15 +131,11 @@ class ModelSchema(Schema, metaclass=ModelSchemaMeta):
         self._instance = instance
         super().load(data, **kwargs)
 
-#     @pre_dump
-#     def dump_relations(self, data, pass_many=False):
-#         for k, v in self.declared_fields.items():
-#             if isinstance(v, ForeignKey):
-#
-#
-#
-#
-# class ForeignKey(fields.Nested):
-#     def __init__(self, nested, field_name, **kwargs):
-#         super().__init__(nested, **kwargs)
-#         self.field_name = field_name
+    def _serialize(self, obj, *, many=False):
+        with timed('dump'):
+            dump = get_compiled_dump(self)
+            if dump is None or obj is None:
+                return super()._serialize(obj, many=many)
+            if many:
+                return dump(obj, self.dump_fields, self.get_attribute)
+            return dump((obj,), self.dump_fields, self.get_attribute)[0]
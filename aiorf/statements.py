@@ -0,0 +1,52 @@
+import hashlib
+import re
+
+_placeholder = re.compile(r'%\((\w+)\)s')
+
+
+class Statement:
+    """
+    An SQLAlchemy statement compiled once and run with fresh parameters.
+
+    Backends hand the compiled SQL straight to the driver, which skips
+    building and compiling the expression on every request. `sql` uses the
+    pyformat placeholders of psycopg2, `numbered_sql` the `$n` ones of
+    Postgres itself, for asyncpg and for `PREPARE`. With `prepare` the aiopg
+    backend also `PREPARE`s the statement once per connection, so Postgres
+    doesn't plan it again either. Statements with the same SQL share the
+    prepared one.
+    """
+    def __init__(self, query, dialect, prepare=False):
+        compiled = query.compile(dialect=dialect)
+        self.sql = str(compiled)
+        self.defaults = {name: bind.effective_value for bind, name in compiled.bind_names.items()
+                         if not bind.required}
+        self.types = {name: bind.type for bind, name in compiled.bind_names.items()}
+        self.processors = compiled._bind_processors
+        self.prepare = prepare
+        self.name = 'aiorf_{}'.format(hashlib.sha1(self.sql.encode('utf-8')).hexdigest()[:16])
+        self.param_names = []
+        for name in _placeholder.findall(self.sql):
+            if name not in self.param_names:
+                self.param_names.append(name)
+        numbered = self.sql
+        for index, name in enumerate(self.param_names, 1):
+            numbered = numbered.replace('%({})s'.format(name), '${}'.format(index))
+        self.numbered_sql = numbered.replace('%%', '%')
+
+    def get_params(self, params):
+        values = dict(self.defaults)
+        values.update(params)
+        for key, processor in self.processors.items():
+            if key in values:
+                values[key] = processor(values[key])
+        return values
+
+    def get_args(self, params, coerce=None):
+        """
+        Parameter values in `$n` order, passed through `coerce(type, value)`.
+        """
+        values = self.get_params(params)
+        if coerce is None:
+            return [values[name] for name in self.param_names]
+        return [coerce(self.types[name], values[name]) for name in self.param_names]
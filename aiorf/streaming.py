@@ -0,0 +1,176 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import math
+import uuid
+
+from aiohttp import web
+
+from aiorf.renderers import default_renderer
+
+JSON = 'json'
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+content_types = {
+    JSON: 'application/json',
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv',
+}
+
+
+def get_stream_format(request, default=JSON):
+    """
+    NDJSON when the client asks for it, the endpoint default otherwise.
+    """
+    if content_types[NDJSON] in request.headers.get('Accept', ''):
+        return NDJSON
+    return default
+
+
+def get_export_format(request, default=CSV):
+    """
+    CSV or NDJSON, from a `format` query parameter or the `Accept` header.
+    """
+    fmt = request.query.get('format')
+    if fmt in (CSV, NDJSON):
+        return fmt
+    accept = request.headers.get('Accept', '')
+    if content_types[NDJSON] in accept:
+        return NDJSON
+    if content_types[CSV] in accept:
+        return CSV
+    return default
+
+
+def _clock_text(value, full_offset):
+    """
+    The time of day of a `time` or `datetime` as Postgres writes it:
+    fractions without trailing zeros, an offset with minutes only when
+    there are some unless `full_offset`, as in JSON.
+    """
+    text = '{:02d}:{:02d}:{:02d}'.format(value.hour, value.minute, value.second)
+    if value.microsecond:
+        text += '.' + '{:06d}'.format(value.microsecond).rstrip('0')
+    offset = value.utcoffset()
+    if offset is not None:
+        minutes = abs(int(offset.total_seconds())) // 60
+        text += '{}{:02d}'.format('-' if offset < datetime.timedelta(0) else '+', minutes // 60)
+        if minutes % 60 or full_offset:
+            text += ':{:02d}'.format(minutes % 60)
+    return text
+
+
+def _text_value(value):
+    """
+    `value` in Postgres' text output, as `COPY ... CSV` writes it.
+    """
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime.datetime):
+        return '{} {}'.format(value.date().isoformat(), _clock_text(value, False))
+    if isinstance(value, datetime.time):
+        return _clock_text(value, False)
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else '-Infinity' if value < 0 else 'Infinity'
+    if isinstance(value, (dict, list)):
+        return default_renderer.render(value).decode('utf-8')
+    return value
+
+
+def _json_value(value):
+    """
+    `value` as `row_to_json` writes it: numerics as numbers, timestamps in
+    ISO 8601 and non-finite floats as strings.
+    """
+    if isinstance(value, decimal.Decimal) and value.is_finite():
+        return str(value)
+    if isinstance(value, (decimal.Decimal, float)) and not math.isfinite(value):
+        return json.dumps(_text_value(float(value)))
+    if isinstance(value, datetime.datetime):
+        return json.dumps('{}T{}'.format(value.date().isoformat(), _clock_text(value, True)))
+    if isinstance(value, datetime.time):
+        return json.dumps(_clock_text(value, True))
+    return default_renderer.render(value).decode('utf-8')
+
+
+def format_rows(rows, fmt, header=False):
+    """
+    Rows as CSV, with a header line of their keys first when `header`, or
+    as NDJSON, formatted the way Postgres' `COPY` and `row_to_json` write
+    them so exports don't depend on the backend.
+    """
+    if fmt == NDJSON:
+        return ''.join('{' + ','.join(
+            json.dumps(str(key), ensure_ascii=False) + ':' + _json_value(value) for key, value in dict(row).items()
+        ) + '}\n' for row in rows).encode('utf-8')
+    out = io.StringIO()
+    # COPY ends lines with a bare newline
+    writer = csv.writer(out, lineterminator='\n')
+    if header and rows:
+        writer.writerow(list(rows[0].keys()))
+    writer.writerows([_text_value(value) for value in dict(row).values()] for row in rows)
+    return out.getvalue().encode('utf-8')
+
+
+def _cursor_name():
+    return 'aiorf_{}'.format(uuid.uuid4().hex)
+
+
+async def iter_peewee_cursor(manager, queryset, batch_size):
+    """
+    Yield lists of dicts read from a server-side cursor for a peewee queryset.
+
+    psycopg2 has no named cursors in async mode, so the cursor is declared
+    in SQL and lives in a transaction that ends with the iteration.
+    """
+    name = _cursor_name()
+    sql, params = queryset.sql()
+    async with manager.transaction():
+        cursor = await manager.database.cursor_async()
+        try:
+            await cursor.execute('DECLARE {} NO SCROLL CURSOR FOR {}'.format(name, sql), params)
+            while True:
+                await cursor.execute('FETCH FORWARD {} FROM {}'.format(batch_size, name))
+                rows = await cursor.fetchall()
+                if not rows:
+                    break
+                columns = [column[0] for column in cursor.description]
+                yield [dict(zip(columns, row)) for row in rows]
+                if len(rows) < batch_size:
+                    break
+        finally:
+            await cursor.release
+
+
+async def stream_response(request, batches, dump, fmt=JSON, headers=None):
+    """
+    Write batches of rows to a chunked response as they arrive, either as
+    a single JSON array or as newline delimited JSON.
+
+    Only one batch is held in memory at a time.
+    """
+    response = web.StreamResponse(headers=headers)
+    response.content_type = content_types[fmt]
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    first = True
+    if fmt == JSON:
+        await response.write(b'[')
+    async for batch in batches:
+        items = [default_renderer.render(item) for item in dump(batch)]
+        if fmt == NDJSON:
+            chunk = b'\n'.join(items) + b'\n'
+        else:
+            chunk = b','.join(items)
+            if not first:
+                chunk = b',' + chunk
+        first = False
+        await response.write(chunk)
+    if fmt == JSON:
+        await response.write(b']')
+    await response.write_eof()
+    return response
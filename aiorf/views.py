@@ -1,6 +1,18 @@
-from aiohttp.web import View
+import peewee
+from aiohttp.web import HTTPException, View
 
 from aiorf import mixins
+from aiorf.admission import Admission
+from aiorf.compression import Compression
+from aiorf.conditional import check_if_match, get_etag
+from aiorf.counting import ExactCount
+from aiorf.exceptions import NotFoundError
+from aiorf.fieldsets import get_attribute_names, get_fieldset, narrow_schema
+from aiorf.metrics import default_metrics, start_timings, stop_timings, timed
+from aiorf.modelschema import object_id_name
+from aiorf.relations import prefetch_related
+from aiorf.replicas import SAFE_METHODS, reads_from_primary, set_sticky
+from aiorf.renderers import ArrowRenderer, JSONRenderer, MessagePackRenderer, render_response, select_renderer
 
 
 class APIView(View):
@@ -13,14 +25,101 @@ class GenericAPIView(APIView):
     lookup_url_kwarg = None
     pagination_class = None
     filter_backends = []
+    filter_fields = []
+    renderer_classes = (JSONRenderer, MessagePackRenderer, ArrowRenderer)
+    compression = Compression()
+    admission = Admission()
+    replicas = None
+    sticky_seconds = 5
+    metrics = default_metrics
+    server_timing = False
+    count_strategy = ExactCount()
+    bulk_max_rows = None
+    object_cache = None
+    etag_field = None
+    last_modified_field = None
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.queryset = self.get_queryset()
-        if self.lookup_field == 'pk':
-            if not self.lookup_url_kwarg:
-                self.lookup_url_kwarg = 'pk'
-            self.lookup_field = self.serializer_class.Meta.model._meta.primary_key.name
+        self.lookup_field, self.lookup_url_kwarg = self.get_lookup()
+
+    @classmethod
+    def get_lookup(cls):
+        """
+        `(lookup_field, lookup_url_kwarg)` with `'pk'` resolved to the
+        model's primary key, once per view class.
+        """
+        lookup = cls.__dict__.get('_lookup')
+        if lookup is None:
+            lookup = cls.lookup_field, cls.lookup_url_kwarg
+            if cls.lookup_field == 'pk':
+                lookup = cls.serializer_class.Meta.model._meta.primary_key.name, cls.lookup_url_kwarg or 'pk'
+            cls._lookup = lookup
+        return lookup
+
+    async def _iter(self):
+        return await self.handle(super()._iter)
+
+    async def handle(self, handler):
+        timings, timings_token = start_timings()
+        # Anything but an HTTP error escaping is a 500
+        status = 500
+        try:
+            async with self.admission.admit(self.request.method):
+                response = await handler()
+            response = await self.finalize_response(response)
+            status = 200 if response is None else response.status
+        except HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            self.release_read_manager()
+            stop_timings(timings_token)
+            timings.finish()
+            if self.metrics is not None:
+                self.metrics.observe(type(self).__name__, self.request.method, status, timings)
+        if self.server_timing and response is not None and not response.prepared:
+            response.headers['Server-Timing'] = timings.header()
+        return response
+
+    @property
+    def read_manager(self):
+        """
+        The manager for reads: one of the `replicas` with the fewest
+        requests in flight for safe requests, `manager` for writes and
+        for clients that wrote in the last `sticky_seconds`.
+        """
+        if not hasattr(self, '_read_manager'):
+            self._read_manager = self.manager
+            self._replica = None
+            if self.replicas is not None and not reads_from_primary(self.request):
+                router = self.replicas.router
+                router.start()
+                self._replica = router.pick()
+                if self._replica is not None:
+                    router.acquire(self._replica)
+                    self._read_manager = router.replicas[self._replica]
+        return self._read_manager
+
+    def release_read_manager(self):
+        if getattr(self, '_replica', None) is not None:
+            self.replicas.router.release(self._replica)
+            self._replica = None
+
+    async def finalize_response(self, response):
+        """
+        Last step of every response: keeping a writing client on the
+        primary for `sticky_seconds`, and compressing the body.
+        """
+        if (self.replicas is not None and self.request.method not in SAFE_METHODS
+                and response is not None and response.status < 400):
+            set_sticky(response, self.sticky_seconds)
+        if self.compression is not None:
+            with timed('compress'):
+                response = await self.compression.compress_response(self.request, response)
+        return response
 
     def get_serializer_context(self):
         """
@@ -43,32 +142,162 @@ class GenericAPIView(APIView):
         # kwargs['context'] = self.get_serializer_context()
         return serializer_class(*args, **kwargs)
 
+    def get_renderers(self):
+        """
+        Instances of the available `renderer_classes`, created once per
+        view class.
+        """
+        cls = type(self)
+        renderers = cls.__dict__.get('_renderers')
+        if renderers is None:
+            renderers = cls._renderers = [renderer() for renderer in self.renderer_classes if renderer.available]
+        return renderers
+
+    def get_renderer(self):
+        """
+        The renderer negotiated from the `Accept` header of the request.
+        """
+        if not hasattr(self, '_renderer'):
+            self._renderer = select_renderer(self.request, self.get_renderers())
+        return self._renderer
+
+    def render(self, data, status=200, headers=None):
+        return render_response(self.get_renderer(), data, status=status, headers=headers)
+
+    def get_fieldset(self):
+        return get_fieldset(self.request, self.fields_query_param, self.exclude_query_param)
+
+    def get_fieldset_serializer(self):
+        """
+        Return the serializer narrowed to the fields asked for in the query
+        string. Only meant for output.
+        """
+        only, exclude = self.get_fieldset()
+        if only is None and exclude is None:
+            return self.get_serializer()
+        return narrow_schema(self.get_serializer_class(), only, exclude)
+
+    def select_fields(self, queryset, serializer):
+        """
+        Narrow the columns of `queryset` to what `serializer` dumps, keeping
+        the primary key, lookup, validator and ordering fields.
+        """
+        only, exclude = self.get_fieldset()
+        if only is None and exclude is None:
+            return queryset
+        model = queryset.model_class
+        pk_name = model._meta.primary_key.name
+        extra = [pk_name, self.lookup_field, self.etag_field, self.last_modified_field]
+        if self.paginator is not None:
+            extra.extend(self.paginator.get_ordering(self, pk_name)[0])
+        names = get_attribute_names(serializer, extra)
+        # Generated foreign key fields read the raw id attribute
+        return queryset.select(*[
+            field for field in model._meta.sorted_fields
+            if field.name in names or isinstance(field, peewee.ForeignKeyField) and object_id_name(field) in names
+        ])
+
     def get_queryset(self):
         return self.serializer_class.Meta.model.select()
 
-    async def get_object(self):
+    async def prefetch_related(self, serializer, objs):
+        """
+        Attach the related objects of `serializer`'s `ForeignKey` fields,
+        one query per relation.
+        """
+        return await prefetch_related(self.read_manager, self.serializer_class.Meta.model, serializer, objs)
+
+    async def iter_related(self, serializer, batches):
+        async for batch in batches:
+            yield await self.prefetch_related(serializer, batch)
+
+    async def get_object(self, use_cache=True, queryset=None):
         """
         Returns the object the view is displaying.
         You may want to override this if you need to provide non-standard
         queryset lookups.  Eg if objects are referenced using multiple
         keyword arguments in the url conf.
+
+        `queryset` narrows the lookup when the object isn't read from the
+        cache, which always holds whole objects.
         """
-        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.filter_queryset(queryset if queryset is not None else self.get_queryset())
 
         # Perform the lookup filtering.
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
 
-        filter_kwargs = {self.lookup_field: self.request.match_info[lookup_url_kwarg]}
-        obj = await self.manager.get(self.serializer_class.Meta.model, **filter_kwargs)
+        value = self.request.match_info[lookup_url_kwarg]
+        filter_kwargs = {self.lookup_field: value}
+        model = self.serializer_class.Meta.model
+        try:
+            if use_cache and self.object_cache is not None:
+                # Filled from the primary, a lagging replica would put back
+                # objects that a write just invalidated
+                obj = await self.object_cache.get_or_load(
+                    model, value, lambda: self.manager.get(model, **filter_kwargs))
+            elif use_cache:
+                with timed('db'):
+                    obj = await self.read_manager.get(queryset, **filter_kwargs)
+            else:
+                # Writes start from the primary
+                with timed('db'):
+                    obj = await self.manager.get(queryset, **filter_kwargs)
+        except model.DoesNotExist:
+            raise NotFoundError
 
         # May raise a permission denied
         # self.check_object_permissions(self.request, obj)
 
         return obj
 
+    async def invalidate_object(self, instance=None):
+        """
+        Drop one cached object, or all objects of the model without an instance.
+        """
+        if self.object_cache is None:
+            return
+        model = self.serializer_class.Meta.model
+        if instance is None:
+            self.object_cache.invalidate_model(model)
+        else:
+            await self.object_cache.invalidate(model, getattr(instance, self.lookup_field))
+
+    async def get_write_object(self):
+        """
+        The stored object a write starts from, checked against `If-Match`.
+        With the header the row is read `FOR UPDATE`, so in the transaction
+        of the write no other write gets in between the check and it.
+        """
+        queryset = self.get_queryset()
+        if 'If-Match' in self.request.headers:
+            queryset = queryset.for_update()
+        instance = await self.get_object(use_cache=False, queryset=queryset)
+        self.check_precondition(instance)
+        return instance
+
+    def check_precondition(self, instance):
+        """
+        Fail with 412 when `If-Match` doesn't list the etag of `instance`.
+        """
+        if 'If-Match' not in self.request.headers:
+            return
+        etag = get_etag(instance, self.get_serializer().dump, self.etag_field, self.last_modified_field,
+                        renderer=self.get_renderer())
+        check_if_match(self.request, etag)
+
+    def get_filter_backends(self):
+        """
+        Instances of `filter_backends`, created once per view class.
+        """
+        cls = type(self)
+        backends = cls.__dict__.get('_filter_backends')
+        if backends is None:
+            backends = cls._filter_backends = [backend() for backend in self.filter_backends]
+        return backends
+
     def filter_queryset(self, queryset):
-        for backend in list(self.filter_backends):
-            queryset = backend().filter_queryset(self.request, queryset, self)
+        for backend in self.get_filter_backends():
+            queryset = backend.filter_queryset(self.request, queryset, self)
         return queryset
 
     @property
@@ -96,7 +325,7 @@ class GenericAPIView(APIView):
         Return a paginated style `Response` object for the given output data.
         """
         assert self.paginator is not None
-        return self.paginator.get_paginated_response(data)
+        return self.paginator.get_paginated_response(data, self.get_renderer())
 
 
 class CreateAPIView(mixins.CreateModelMixin,
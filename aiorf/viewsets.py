@@ -5,30 +5,50 @@ from aiorf.views import GenericAPIView
 
 
 class GenericViewSet(GenericAPIView):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        async def method_not_allowed(self):
-            raise web.HTTPMethodNotAllowed
-        super().__init__(*args, **kwargs)
-        for method in ['create', 'list', 'retrieve', 'update', 'partial_update', 'destroy', 'list']:
-            if not hasattr(self, method):
-                setattr(self, method, method_not_allowed)
+    """
+    Actions of a viewset are routed by `get_routes`, or for many viewsets
+    by `aiorf.routers.DefaultRouter`. Methods without an action are
+    answered with 405 by aiohttp's router.
+    """
+    action = None
+    # method, path under the viewset's path with `{lookup}`, action
+    action_map = [
+        ('get', '', 'list'),
+        ('post', '', 'create'),
+        ('patch', '', 'bulk_update'),
+        ('delete', '', 'bulk_destroy'),
+        ('post', '/import', 'bulk_import'),
+        ('get', '/{lookup}', 'retrieve'),
+        ('put', '/{lookup}', 'update'),
+        ('patch', '/{lookup}', 'partial_update'),
+        ('delete', '/{lookup}', 'destroy'),
+    ]
+
+    @classmethod
+    def get_actions(cls):
+        """
+        `(method, path, action)` of the actions the viewset implements.
+        """
+        return [(method, path, action) for method, path, action in cls.action_map if hasattr(cls, action)]
+
+    @classmethod
+    def as_handler(cls, action):
+        """
+        A request handler running `action` on a new viewset instance.
+        """
+        async def handler(request):
+            view = cls(request)
+            view.action = action
+            return await view.handle(getattr(view, action))
+        return handler
 
     @classmethod
     def get_routes(cls, path):
-        def wrap(klass, method):
-            async def wrapped(request):
-                print(request.match_info.keys())
-                r = klass(request)
-                return await getattr(r, method)()
-            return wrapped
+        lookup_field, lookup_url_kwarg = cls.get_lookup()
+        lookup = '{{{}}}'.format(lookup_url_kwarg or lookup_field)
         return [
-            web.route('get', r'{}/{{{}}}'.format(path, cls.lookup_url_kwarg or cls.lookup_field), wrap(cls, 'retrieve')),
-            web.route('get', r'{}'.format(path), wrap(cls, 'list')),
-            web.route('post', r'{}'.format(path), wrap(cls, 'create')),
-            web.route('delete', r'{}'.format(path), wrap(cls, 'destroy')),
-            web.route('put', r'{}/<{}:\d+>'.format(path, cls.lookup_url_kwarg or cls.lookup_field), wrap(cls, 'update')),
-            web.route('patch', r'{}/<{}:\d+>'.format(path, cls.lookup_url_kwarg or cls.lookup_field), wrap(cls, 'partial_update')),
+            web.route(method, path + action_path.format(lookup=lookup), cls.as_handler(action))
+            for method, action_path, action in cls.get_actions()
         ]
 
 
@@ -42,13 +62,15 @@ class ReadOnlyModelViewSet(mixins.RetrieveModelMixin,
 
 
 class ModelViewSet(mixins.CreateModelMixin,
+                   mixins.ImportModelMixin,
                    mixins.RetrieveModelMixin,
                    mixins.UpdateModelMixin,
                    mixins.DestroyModelMixin,
                    mixins.ListModelMixin,
                    GenericViewSet):
     """
-    A viewset that provides default `create()`, `retrieve()`, `update()`,
-    `partial_update()`, `destroy()` and `list()` actions.
+    A viewset that provides default `create()`, `bulk_import()`,
+    `retrieve()`, `update()`, `partial_update()`, `destroy()` and `list()`
+    actions.
     """
     pass
@@ -0,0 +1,103 @@
+"""
+Per-request dispatch overhead of viewsets: the handlers of
+`DefaultRouter`, against viewsets set up per request the way
+`GenericViewSet.get_routes` did before the router. The action itself
+returns right away, so the times are creating the viewset and running
+`handle` around it.
+
+    python -m benchmarks.dispatch
+"""
+import asyncio
+import time
+
+import peewee
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from aiorf import modelschema
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+
+
+class Item(peewee.Model):
+    name = peewee.CharField(max_length=100)
+
+    class Meta:
+        database = peewee.SqliteDatabase(':memory:')
+
+
+class ItemSchema(modelschema.ModelSchema):
+    class Meta:
+        model = Item
+
+
+class ItemViewSet(ModelViewSet):
+    serializer_class = ItemSchema
+
+    async def retrieve(self):
+        return web.Response()
+
+
+class LegacyItemViewSet(ItemViewSet):
+    """
+    Instance setup of the viewsets routed by the closures of `get_routes`:
+    two `__init__` runs, each building the queryset and resolving the
+    lookup, and 405 handlers set for every missing action.
+    """
+    def __init__(self, *args, **kwargs):
+        async def method_not_allowed(self):
+            raise web.HTTPMethodNotAllowed
+        for _ in range(2):
+            super().__init__(*args, **kwargs)
+            self.queryset = self.get_queryset()
+            self.lookup_field, self.lookup_url_kwarg = type(self).lookup_field, type(self).lookup_url_kwarg
+            if self.lookup_field == 'pk':
+                self.lookup_url_kwarg = self.lookup_url_kwarg or 'pk'
+                self.lookup_field = self.serializer_class.Meta.model._meta.primary_key.name
+        for method in ['create', 'list', 'retrieve', 'update', 'partial_update', 'destroy', 'list',
+                       'bulk_update', 'bulk_destroy']:
+            if not hasattr(self, method):
+                setattr(self, method, method_not_allowed)
+
+
+def legacy_handler(klass, method):
+    async def wrapped(request):
+        r = klass(request)
+        return await r.handle(getattr(r, method))
+    return wrapped
+
+
+def router_handler():
+    router = DefaultRouter()
+    router.register('/items', ItemViewSet)
+    for route in router.get_routes():
+        if route.method.upper() == 'GET' and '{' in route.path:
+            return route.handler
+
+
+async def measure(handler, request, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        await handler(request)
+    return (time.perf_counter() - start) / number
+
+
+async def run(number):
+    request = make_mocked_request('GET', '/items/1', match_info={'pk': '1'})
+    results = {}
+    for label, handler in (('get_routes', legacy_handler(LegacyItemViewSet, 'retrieve')),
+                           ('DefaultRouter', router_handler())):
+        await measure(handler, request, number // 10)
+        results[label] = min([await measure(handler, request, number) for _ in range(3)])
+    return results
+
+
+def main(number=20000):
+    results = asyncio.get_event_loop().run_until_complete(run(number))
+    for label, seconds in results.items():
+        print('{:<16} {:8.2f} us/request'.format(label, seconds * 1e6))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare marshmallow's generic dump with the compiled dump of a
+`saschema.ModelSchema` on 10k rows.
+
+    python -m benchmarks.dump
+"""
+import datetime
+import timeit
+
+import sqlalchemy as sa
+
+from aiorf.saschema import ModelSchema
+
+metadata = sa.MetaData()
+
+table = sa.Table(
+    'items', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+    sa.Column('price', sa.Float),
+    sa.Column('active', sa.Boolean),
+    sa.Column('created', sa.DateTime),
+    sa.Column('day', sa.Date),
+)
+
+
+class ItemSchema(ModelSchema):
+    class Meta:
+        table = table
+
+
+class CompiledItemSchema(ModelSchema):
+    class Meta:
+        table = table
+        compiled = True
+
+
+def make_rows(count):
+    now = datetime.datetime(2020, 1, 1, 12, 30)
+    return [{
+        'id': i,
+        'name': 'item {}'.format(i),
+        'price': i * 1.5,
+        'active': i % 2 == 0,
+        'created': now + datetime.timedelta(seconds=i),
+        'day': now.date(),
+    } for i in range(count)]
+
+
+def main(count=10000, number=20):
+    rows = make_rows(count)
+    generic, compiled = ItemSchema(), CompiledItemSchema()
+    assert generic.dump(rows, many=True) == compiled.dump(rows, many=True)
+
+    results = {}
+    for label, schema in (('marshmallow', generic), ('compiled', compiled)):
+        seconds = min(timeit.repeat(lambda: schema.dump(rows, many=True), number=number, repeat=3))
+        results[label] = seconds / number
+        print('{:<12} {:8.2f} ms per {} rows'.format(label, results[label] * 1000, count))
+    print('speedup      {:8.2f}x'.format(results['marshmallow'] / results['compiled']))
+    return results
+
+
+if __name__ == '__main__':
+    main()
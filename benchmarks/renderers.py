@@ -0,0 +1,40 @@
+"""
+Encoding time and body size of a 1000-row list for `json.dumps`, as
+`web.json_response` does, against each available renderer.
+
+    python -m benchmarks.renderers
+"""
+import datetime
+import json
+import timeit
+
+from aiorf.renderers import ArrowRenderer, JSONRenderer, MessagePackRenderer
+
+ROWS = [
+    {
+        'id': index,
+        'name': 'item {}'.format(index),
+        'price': index * 1.5,
+        'active': index % 2 == 0,
+        'created': (datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index)).isoformat(),
+    }
+    for index in range(1000)
+]
+
+
+def main(number=200):
+    encoders = [('json.dumps', lambda data: json.dumps(data).encode('utf-8'))]
+    for renderer_class in (JSONRenderer, MessagePackRenderer, ArrowRenderer):
+        if renderer_class.available:
+            encoders.append((renderer_class.__name__, renderer_class().render))
+
+    results = {}
+    for label, encode in encoders:
+        seconds = min(timeit.repeat(lambda: encode(ROWS), number=number, repeat=3)) / number
+        results[label] = seconds, len(encode(ROWS))
+        print('{:<20} {:8.3f} ms {:8d} bytes'.format(label, seconds * 1e3, results[label][1]))
+    return results
+
+
+if __name__ == '__main__':
+    main()
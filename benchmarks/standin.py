@@ -0,0 +1,206 @@
+"""
+In-process SQLite stand-ins for Postgres, so the benchmarks run without a
+database server.
+
+`SQLitePool` is shaped like an asyncpg pool and goes behind the real
+`AsyncpgBackend`, so `Endpoint` requests run their usual statements,
+parameter coercion and row handling. `AsyncSQLiteDatabase` is a
+peewee_async database for the generic views. Queries run synchronously
+on the event loop, which keeps the timings about aiorf rather than about
+a driver. SQLite has `RETURNING` from 3.35 on.
+"""
+import asyncio
+import datetime
+import hashlib
+import re
+import sqlite3
+
+import peewee
+import peewee_async
+
+_numbered = re.compile(r'\$(\d+)')
+_staging = re.compile(r'CREATE TEMPORARY TABLE (\w+) \(LIKE (\S+) INCLUDING DEFAULTS\) ON COMMIT DROP')
+_locking = re.compile(r' FOR UPDATE\b')
+# `string_agg(value, sep ORDER BY ...)`, a nesting level of parentheses deep
+_aggregate_order = re.compile(r'(string_agg\((?:[^()]|\([^()]*\))*?) ORDER BY [^()]*\)')
+
+# Written timestamps may be ISO strings, which Postgres would cast
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.datetime.fromisoformat(value.decode()))
+
+
+def connect(path):
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.create_function('md5', 1, lambda value: None if value is None else hashlib.md5(value.encode()).hexdigest())
+    conn.create_aggregate('string_agg', 2, _StringAgg)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    return conn
+
+
+class _StringAgg:
+    def __init__(self):
+        self.values = []
+        self.sep = ''
+
+    def step(self, value, sep):
+        self.sep = sep
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return self.sep.join(self.values) if self.values else None
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        self.conn.execute('BEGIN')
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class SQLiteConnection:
+    """
+    The part of `asyncpg.Connection` that `AsyncpgBackend` uses.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _run(self, sql, args):
+        # `$n` placeholders are `?n` in SQLite
+        sql = _numbered.sub(r'?\1', sql)
+        # Import staging tables, left until the connection closes
+        sql = _staging.sub(r'CREATE TEMPORARY TABLE \1 AS SELECT * FROM \2 WHERE 0', sql)
+        # SQLite locks the whole database for writes, rows need no locks
+        sql = _locking.sub('', sql)
+        # Aggregates take no ORDER BY before SQLite 3.44, rows come in rowid order
+        sql = _aggregate_order.sub(r'\1)', sql)
+        return self.conn.execute(sql, args)
+
+    async def execute(self, sql, *args):
+        cursor = self._run(sql, args)
+        return '{} {}'.format(sql.split(None, 1)[0].upper(), max(cursor.rowcount, 0))
+
+    async def fetch(self, sql, *args):
+        return self._run(sql, args).fetchall()
+
+    async def fetchrow(self, sql, *args):
+        return self._run(sql, args).fetchone()
+
+    async def fetchval(self, sql, *args):
+        row = self._run(sql, args).fetchone()
+        return None if row is None else row[0]
+
+    async def copy_records_to_table(self, table_name, *, records, columns):
+        self.conn.executemany('INSERT INTO {} ({}) VALUES ({})'.format(
+            table_name, ', '.join(columns), ', '.join('?' * len(columns))), records)
+
+    def transaction(self):
+        return _Transaction(self.conn)
+
+
+class _PoolAcquire:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    async def __aenter__(self):
+        self.conn = await self.pool.queue.get()
+        return self.conn
+
+    async def __aexit__(self, *exc_info):
+        self.pool.queue.put_nowait(self.conn)
+
+
+class SQLitePool:
+    """
+    `size` connections to the SQLite file at `path`, handed out like
+    asyncpg's pool does.
+    """
+    def __init__(self, path, size=4):
+        self.queue = asyncio.Queue()
+        for _ in range(size):
+            self.queue.put_nowait(SQLiteConnection(connect(path)))
+
+    def acquire(self):
+        return _PoolAcquire(self)
+
+
+class _AsyncCursor:
+    def __init__(self, cursor, release):
+        self.cursor = cursor
+        # peewee_async awaits `cursor.release` itself
+        self.release = release
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    async def execute(self, sql, *args):
+        self.cursor.execute(_locking.sub('', sql), *args)
+
+    async def fetchone(self):
+        return self.cursor.fetchone()
+
+    async def fetchall(self):
+        return self.cursor.fetchall()
+
+
+async def _noop():
+    pass
+
+
+class AsyncSQLiteConnection:
+    """
+    peewee_async connection "pool" of one SQLite connection.
+    """
+    def __init__(self, *, database=None, loop=None, timeout=None, **kwargs):
+        self.database = database
+        self.conn = None
+
+    async def connect(self):
+        # Typed columns come back as python values, the way psycopg2 returns them
+        self.conn = sqlite3.connect(self.database, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                                    check_same_thread=False)
+
+    async def acquire(self):
+        return self.conn
+
+    def release(self, conn):
+        pass
+
+    async def cursor(self, conn=None, *args, **kwargs):
+        return _AsyncCursor(self.conn.cursor(), _noop())
+
+    async def close(self):
+        self.conn.close()
+
+
+class AsyncSQLiteDatabase(peewee_async.AsyncDatabase, peewee.SqliteDatabase):
+    """
+    SQLite behind peewee_async, with `RETURNING` enabled so the views run
+    the statements they run on Postgres.
+    """
+    returning_clause = True
+    _async_conn_cls = AsyncSQLiteConnection
+
+    @property
+    def connect_kwargs_async(self):
+        return {}
+
+    async def last_insert_id_async(self, cursor, model):
+        return cursor.lastrowid
@@ -0,0 +1,73 @@
+"""
+Boot cost of a large model registry: defining schema classes for 500
+synthetic peewee models and as many SQLAlchemy tables, then the first
+instantiation of every schema, as a worker's first requests would.
+
+    python -m benchmarks.startup
+"""
+import time
+
+import peewee
+import sqlalchemy as sa
+
+from aiorf import modelschema, saschema
+
+PEEWEE_FIELDS = [
+    peewee.CharField, peewee.TextField, peewee.IntegerField, peewee.FloatField, peewee.DecimalField,
+    peewee.BooleanField, peewee.DateTimeField, peewee.DateField, peewee.UUIDField, peewee.BigIntegerField,
+    peewee.FixedCharField, peewee.SmallIntegerField,
+]
+
+SA_TYPES = [
+    sa.String(100), sa.Text(), sa.Integer(), sa.Float(), sa.Numeric(), sa.Boolean(), sa.DateTime(),
+    sa.Date(), sa.BigInteger(), sa.Unicode(50), sa.SmallInteger(), sa.Time(),
+]
+
+
+def make_models(count, fields):
+    database = peewee.SqliteDatabase(':memory:')
+    models = []
+    for index in range(count):
+        attrs = {'f{}'.format(i): PEEWEE_FIELDS[(index + i) % len(PEEWEE_FIELDS)](null=True)
+                 for i in range(fields)}
+        attrs['Meta'] = type('Meta', (), {'database': database, 'db_table': 'model_{}'.format(index)})
+        models.append(type('Model{}'.format(index), (peewee.Model,), attrs))
+    return models
+
+
+def make_tables(count, fields):
+    metadata = sa.MetaData()
+    return [
+        sa.Table('table_{}'.format(index), metadata, sa.Column('id', sa.Integer, primary_key=True),
+                 *[sa.Column('c{}'.format(i), SA_TYPES[(index + i) % len(SA_TYPES)]) for i in range(fields)])
+        for index in range(count)
+    ]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main(count=500, fields=12):
+    models, tables = make_models(count, fields), make_tables(count, fields)
+    results = {}
+    for label, module, targets, option in (
+            ('peewee', modelschema, models, 'model'),
+            ('sqlalchemy', saschema, tables, 'table')):
+        classes, define = timed(lambda: [
+            type(module.ModelSchema)('Schema{}'.format(index), (module.ModelSchema,), {
+                'Meta': type('Meta', (), {option: target}),
+            })
+            for index, target in enumerate(targets)
+        ])
+        _, first_use = timed(lambda: [schema_class() for schema_class in classes])
+        results[label] = define, first_use
+        print('{:<12} define {:8.2f} ms  first use {:8.2f} ms  ({} schemas)'.format(
+            label, define * 1e3, first_use * 1e3, count))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Per-request cost of building the retrieve query: a new SQLAlchemy
+expression compiled for every request, as aiopg does for expressions,
+against a `Statement` compiled once.
+
+    python -m benchmarks.statements
+"""
+import timeit
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from aiorf.statements import Statement
+
+metadata = sa.MetaData()
+
+table = sa.Table(
+    'items', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+    sa.Column('price', sa.Float),
+    sa.Column('created', sa.DateTime),
+)
+
+
+def main(number=20000):
+    dialect = PGDialect_psycopg2()
+
+    def build():
+        query = table.select().where(table.c.id == 42)
+        compiled = query.compile(dialect=dialect)
+        return str(compiled), compiled.construct_params()
+
+    statement = Statement(table.select().where(table.c.id == sa.bindparam('lookup')), dialect)
+
+    def cached():
+        return statement.sql, statement.get_params({'lookup': 42})
+
+    results = {}
+    for label, func in (('build', build), ('cached', cached)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[label] = seconds / number
+        print('{:<8} {:8.2f} us per request'.format(label, results[label] * 1e6))
+    print('speedup  {:8.2f}x'.format(results['build'] / results['cached']))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Requests per second and latency percentiles of the `Endpoint` and
+`ModelViewSet` hot paths, and schema dump/load microbenchmarks, without a
+database server: both run on SQLite through `benchmarks.standin` and are
+requested through aiohttp's test server.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare results.json
+
+Results are written as JSON. `--compare` reruns the suite and exits with
+status 1 when a result got slower than the baseline by more than
+`--tolerance`.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+
+import peewee
+import peewee_async
+import sqlalchemy as sa
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from aiorf import modelschema, saschema
+from aiorf.backends import AsyncpgBackend
+from aiorf.endpoint import Endpoint
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+from benchmarks.standin import AsyncSQLiteDatabase, SQLitePool, connect
+
+SMALL, LARGE = 100, 10000
+BULK_SIZE = 100
+IMPORT_SIZE = 10000
+NOW = datetime.datetime(2020, 1, 1, 12, 30)
+
+DDL = ('CREATE TABLE {} (id INTEGER PRIMARY KEY, name VARCHAR(100), price REAL, '
+       'active BOOLEAN, created TIMESTAMP)')
+
+metadata = sa.MetaData()
+
+
+def make_table(name):
+    return sa.Table(
+        name, metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(100)),
+        sa.Column('price', sa.Float),
+        sa.Column('active', sa.Boolean),
+        sa.Column('created', sa.DateTime),
+    )
+
+
+def make_endpoint(table, endpoint_path):
+    class Model:
+        __table__ = table
+        id = table.c.id
+
+    class Schema(saschema.ModelSchema):
+        class Meta:
+            pass
+        Meta.table = table
+
+    class BenchEndpoint(Endpoint):
+        model = Model
+        schema = Schema()
+        path = endpoint_path
+
+    return BenchEndpoint
+
+
+def make_model(database, table_name):
+    class Item(peewee.Model):
+        name = peewee.CharField(max_length=100)
+        price = peewee.FloatField()
+        active = peewee.BooleanField()
+        created = peewee.DateTimeField()
+
+        class Meta:
+            pass
+        Meta.database = database
+        Meta.db_table = table_name
+
+    return Item
+
+
+def make_schema(item_model, compiled=False):
+    class Schema(modelschema.ModelSchema):
+        class Meta:
+            pass
+        Meta.model = item_model
+        Meta.compiled = compiled
+
+    return Schema
+
+
+def make_viewset(item_model, item_manager):
+    class BenchViewSet(ModelViewSet):
+        serializer_class = make_schema(item_model)
+        manager = item_manager
+
+    return BenchViewSet
+
+
+def make_item(index):
+    return {
+        'name': 'item {}'.format(index),
+        'price': index * 1.5,
+        'active': index % 2 == 0,
+        'created': (NOW + datetime.timedelta(seconds=index)).isoformat(),
+    }
+
+
+def seed(path, name, count):
+    conn = connect(path)
+    conn.execute(DDL.format(name))
+    conn.executemany(
+        'INSERT INTO {} (name, price, active, created) VALUES (?, ?, ?, ?)'.format(name),
+        [('item {}'.format(i), i * 1.5, i % 2 == 0, NOW + datetime.timedelta(seconds=i))
+         for i in range(count)])
+    conn.close()
+
+
+def build_app(path):
+    """
+    An application serving the same two tables, one of `SMALL` and one of
+    `LARGE` rows, through an `Endpoint` and a `ModelViewSet` each.
+    """
+    for prefix in ('endpoint', 'viewset'):
+        seed(path, prefix + '_small', SMALL)
+        seed(path, prefix + '_large', LARGE)
+
+    app = web.Application()
+    backend = AsyncpgBackend(SQLitePool(path))
+    for name in ('small', 'large'):
+        endpoint_class = make_endpoint(make_table('endpoint_' + name), '/endpoint/' + name)
+        endpoint_class(backend).setup_routes(app.router)
+
+    database = AsyncSQLiteDatabase(path)
+    manager = peewee_async.Manager(database)
+    router = DefaultRouter()
+    for name in ('small', 'large'):
+        router.register('/viewset/' + name, make_viewset(make_model(database, 'viewset_' + name), manager))
+    router.setup_routes(app.router)
+    database.set_allow_sync(False)
+    return app
+
+
+# name, method, path, body, number of requests
+SCENARIOS = [
+    ('retrieve', 'GET', '/{}/large/1', None, 500),
+    ('list_100', 'GET', '/{}/small', None, 200),
+    ('list_10k', 'GET', '/{}/large', None, 20),
+    ('update', 'PATCH', '/{}/small/1', make_item(-1), 500),
+    ('create', 'POST', '/{}/small', make_item(-2), 500),
+    ('bulk_create', 'POST', '/{}/small', [make_item(-i) for i in range(BULK_SIZE)], 50),
+    ('import', 'POST', '/{}/small/import',
+     b''.join(json.dumps(make_item(-i)).encode() + b'\n' for i in range(IMPORT_SIZE)), 10),
+]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def measure(client, method, url, body, number, concurrency):
+    """
+    Send `number` requests from `concurrency` clients, returns the
+    latencies and the wall time.
+    """
+    if body is None:
+        kwargs = {}
+    elif isinstance(body, bytes):
+        kwargs = {'data': body, 'headers': {'Content-Type': 'application/x-ndjson'}}
+    else:
+        kwargs = {'json': body}
+    latencies = []
+    remaining = iter(range(number))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            async with client.request(method, url, **kwargs) as response:
+                await response.read()
+                if response.status >= 400:
+                    raise RuntimeError('{} {} failed with {}'.format(method, url, response.status))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def run_http(scale=1.0, concurrency=1, only=None):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(os.path.join(directory, 'bench.sqlite3'))
+        async with TestClient(TestServer(app)) as client:
+            for target in ('endpoint', 'viewset'):
+                for name, method, path, body, number in SCENARIOS:
+                    if only and name not in only:
+                        continue
+                    url = path.format(target)
+                    number = max(1, int(number * scale))
+                    await measure(client, method, url, body, max(1, number // 10), 1)
+                    latencies, elapsed = await measure(client, method, url, body, number, concurrency)
+                    latencies.sort()
+                    results.append({
+                        'group': 'http',
+                        'name': '{}.{}'.format(target, name),
+                        'requests': number,
+                        'rps': number / elapsed,
+                        'p50_ms': percentile(latencies, 0.5) * 1e3,
+                        'p99_ms': percentile(latencies, 0.99) * 1e3,
+                    })
+    return results
+
+
+def run_schemas(scale=1.0):
+    """
+    Dump and load of `ModelSchemaMeta` generated schemas, marshmallow's
+    generic dump against the compiled one.
+    """
+    model = make_model(peewee.SqliteDatabase(':memory:'), 'items')
+    generic, compiled = make_schema(model)(), make_schema(model, compiled=True)()
+
+    items = [make_item(i) for i in range(1000)]
+    objs = [model(id=i, **dict(item, created=NOW)) for i, item in enumerate(items)]
+    cases = [
+        ('dump_1', lambda: generic.dump(objs[0]), 1),
+        ('dump_1000', lambda: generic.dump(objs, many=True), 1000),
+        ('dump_1000_compiled', lambda: compiled.dump(objs, many=True), 1000),
+        ('load_1', lambda: generic.load(items[0]), 1),
+        ('load_1000', lambda: generic.validate(items, many=True), 1000),
+    ]
+    results = []
+    for name, func, rows in cases:
+        number = max(1, int(20000 * scale) // rows)
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        results.append({
+            'group': 'schema',
+            'name': 'schema.' + name,
+            'rows': rows,
+            'ops': 1 / seconds,
+            'ms': seconds * 1e3,
+        })
+    return results
+
+
+def compare(baseline, results, tolerance):
+    """
+    Names of the results slower than in `baseline` by more than
+    `tolerance`, a fraction.
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        key = 'rps' if result['group'] == 'http' else 'ops'
+        change = result[key] / before[key] - 1
+        print('{:<32} {:+7.1%}'.format(result['name'], change))
+        if change < -tolerance:
+            regressions.append(result['name'])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the number of requests and runs')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    args = parser.parse_args(argv)
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run_http(args.scale, args.concurrency, args.only))
+    results.extend(run_schemas(args.scale))
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': datetime.datetime.utcnow().isoformat(),
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+
+    for result in results:
+        if result['group'] == 'http':
+            print('{:<32} {:9.1f} req/s  p50 {:7.2f} ms  p99 {:7.2f} ms'.format(
+                result['name'], result['rps'], result['p50_ms'], result['p99_ms']))
+        else:
+            print('{:<32} {:9.1f} ops/s  {:10.4f} ms'.format(result['name'], result['ops'], result['ms']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print('Slower than the baseline: {}'.format(', '.join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,9 +5,9 @@ from aiohttp import web
 from aiohttp_utils.routing import ResourceRouter
 import peewee
 import peewee_async
-from marshmallow.fields import Nested
 from playhouse.fields import ManyToManyField
 from aiorf.modelschema import ModelSchema
+from aiorf.relations import ForeignKey
 from aiorf.viewsets import ModelViewSet
 
 database = peewee_async.PostgresqlDatabase('test')
@@ -39,7 +39,7 @@ class Test(ModelSchema):
         model = TestModel
 
 class Fkey(ModelSchema):
-    test = Nested(Test)
+    test = ForeignKey(Test)
     class Meta:
         model = FkeyModel
 
@@ -0,0 +1,98 @@
+"""
+Tests run against SQLite through the stand-ins of `benchmarks.standin`,
+without a database server.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import peewee
+import peewee_async
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiorf import saschema  # noqa: E402
+from aiorf.backends import AsyncpgBackend  # noqa: E402
+from aiorf.endpoint import Endpoint  # noqa: E402
+from benchmarks import standin  # noqa: E402
+from benchmarks.standin import AsyncSQLiteDatabase, SQLitePool  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    return AsyncSQLiteDatabase(str(tmp_path / 'test.sqlite3'))
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'test.sqlite3')
+
+
+@pytest.fixture
+def manager(database):
+    return peewee_async.Manager(database)
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """
+    SQL run through the stand-ins, as the tests go.
+    """
+    executed = []
+    cursor_execute, run = standin._AsyncCursor.execute, standin.SQLiteConnection._run
+
+    async def record_cursor(self, sql, *args):
+        executed.append(sql)
+        return await cursor_execute(self, sql, *args)
+
+    def record_run(self, sql, args):
+        executed.append(sql)
+        return run(self, sql, args)
+
+    monkeypatch.setattr(standin._AsyncCursor, 'execute', record_cursor)
+    monkeypatch.setattr(standin.SQLiteConnection, '_run', record_run)
+    return executed
+
+
+def make_model(database, table_name, **fields):
+    """
+    A peewee model of `fields` on `database`, with its table created.
+    """
+    attrs = dict(fields, Meta=type('Meta', (), {'database': database, 'db_table': table_name}))
+    model = type(table_name.title(), (peewee.Model,), attrs)
+    model.create_table()
+    return model
+
+
+def make_endpoint(db_path, table, **attrs):
+    """
+    An application serving `table` of the SQLite file at `db_path` through
+    an `Endpoint` with `attrs`, at `/<table name>`.
+    """
+    class Model:
+        __table__ = table
+        id = table.c.id
+
+    class Schema(saschema.ModelSchema):
+        class Meta:
+            pass
+        Meta.table = table
+
+    attrs = dict({'model': Model, 'schema': Schema(), 'path': '/' + table.name}, **attrs)
+    endpoint_class = type(table.name.title() + 'Endpoint', (Endpoint,), attrs)
+    app = web.Application()
+    endpoint_class(AsyncpgBackend(SQLitePool(db_path))).setup_routes(app.router)
+    return app
+
+
+def serve(app, test):
+    """
+    Run `await test(client)` against `app`.
+    """
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            return await test(client)
+    return asyncio.get_event_loop().run_until_complete(run())
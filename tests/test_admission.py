@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from aiorf.admission import Limiter
+from aiorf.exceptions import ServiceUnavailable
+
+
+def test_given_up_waiters_leave_the_queue():
+    limiter = Limiter(limit=1, queue_size=1, timeout=0.01)
+
+    async def run():
+        await limiter.acquire()
+        with pytest.raises(ServiceUnavailable):
+            await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        # Neither waiter holds a place in the queue
+        waiting = asyncio.ensure_future(limiter.acquire(asyncio.get_event_loop().time() + 1))
+        await asyncio.sleep(0)
+        stats = limiter.stats()
+        limiter.release()
+        await waiting
+        return stats, len(limiter.waiters)
+
+    stats, queued = asyncio.get_event_loop().run_until_complete(run())
+    assert stats == {'active': 1, 'waiting': 1, 'rejected': 1}
+    assert queued == 0
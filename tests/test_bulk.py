@@ -0,0 +1,78 @@
+import peewee
+from aiohttp import web
+
+from aiorf import modelschema
+from aiorf.filters import QueryFilterBackend
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+
+from conftest import make_model, serve
+
+
+def make_app(database, manager, backends):
+    item_model = make_model(database, 'item', name=peewee.CharField(), status=peewee.CharField())
+    for index in range(3):
+        item_model.create(name='item {}'.format(index), status='stale' if index else 'fresh')
+    database.set_allow_sync(False)
+
+    class ItemSchema(modelschema.ModelSchema):
+        class Meta:
+            model = item_model
+
+    class ItemViewSet(ModelViewSet):
+        serializer_class = ItemSchema
+        filter_backends = backends
+        filter_fields = ['status']
+
+    ItemViewSet.manager = manager
+    router = DefaultRouter()
+    router.register('/items', ItemViewSet)
+    app = web.Application()
+    router.setup_routes(app.router)
+    return app, item_model
+
+
+def count_rows(database, model):
+    database.set_allow_sync(True)
+    return model.select().count()
+
+
+def test_bulk_writes_without_filter_backends_are_refused(database, manager):
+    app, model = make_app(database, manager, [])
+
+    async def test(client):
+        deleted = await client.delete('/items?status=stale')
+        updated = await client.patch('/items?status=stale', json={'name': 'x'})
+        return deleted.status, updated.status
+
+    assert serve(app, test) == (400, 400)
+    assert count_rows(database, model) == 3
+    assert model.select().where(model.name == 'x').count() == 0
+
+
+def test_bulk_delete_with_filter_backend(database, manager):
+    app, model = make_app(database, manager, [QueryFilterBackend])
+
+    async def test(client):
+        typo = await client.delete('/items?statsu=stale')
+        deleted = await client.delete('/items?status=stale')
+        return typo.status, deleted.status, await deleted.json()
+
+    assert serve(app, test) == (400, 200, {'affected': 2})
+    assert count_rows(database, model) == 1
+
+
+def test_invalid_items_are_bad_requests(database, manager):
+    app, model = make_app(database, manager, [QueryFilterBackend])
+
+    async def test(client):
+        responses = [
+            await client.post('/items', json={'name': 5, 'status': 'fresh'}),
+            await client.patch('/items/1', json={'name': 5}),
+            await client.post('/items', json=[{'name': 5, 'status': 'fresh'}]),
+        ]
+        return [(response.status, (await response.json())['error']) for response in responses]
+
+    errors = {'name': ['Not a valid string.']}
+    assert serve(app, test) == [(400, errors), (400, errors), (400, 'Invalid items')]
+    assert count_rows(database, model) == 3
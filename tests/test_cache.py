@@ -0,0 +1,35 @@
+import asyncio
+
+from aiorf.cache import ObjectCache
+
+
+class Item:
+    pass
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    cache = ObjectCache()
+    loads = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def load_old():
+            loads.append('old')
+            await release.wait()
+            return 'old'
+
+        async def load_new():
+            loads.append('new')
+            return 'new'
+
+        racing = asyncio.ensure_future(cache.get_or_load(Item, 1, load_old))
+        await asyncio.sleep(0)
+        # A write lands while the old row is being loaded
+        await cache.invalidate(Item, 1)
+        release.set()
+        first = await racing
+        return first, await cache.get_or_load(Item, 1, load_new), await cache.get_or_load(Item, 1, load_new)
+
+    assert asyncio.get_event_loop().run_until_complete(run()) == ('old', 'new', 'new')
+    assert loads == ['old', 'new']
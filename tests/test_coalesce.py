@@ -0,0 +1,51 @@
+import asyncio
+
+import sqlalchemy as sa
+
+from aiorf.coalesce import SingleFlight
+from benchmarks.standin import connect
+
+from conftest import make_endpoint, serve
+
+table = sa.Table(
+    'note', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('owner', sa.String(100)),
+    sa.Column('text', sa.String(100)),
+)
+
+
+async def list_own(self, request):
+    """
+    Notes of the user the `Authorization` or `Cookie` header names.
+    """
+    # Keep the request in flight while the other one comes in
+    await asyncio.sleep(0.05)
+    owner = request.headers.get('Authorization') or request.cookies.get('user')
+    async with self.backend.acquire() as conn:
+        recs = await conn.fetch(table.select().where(table.c.owner == owner))
+    return self.render(request, self.schema.dump(recs, many=True))
+
+
+def test_users_do_not_share_coalesced_responses(db_path):
+    conn = connect(db_path)
+    conn.execute('CREATE TABLE note (id INTEGER PRIMARY KEY, owner VARCHAR(100), text VARCHAR(100))')
+    conn.executemany('INSERT INTO note (owner, text) VALUES (?, ?)', [('alice', 'a'), ('bob', 'b')])
+    single_flight = SingleFlight()
+    app = make_endpoint(db_path, table, single_flight=single_flight, list=list_own)
+
+    async def get_texts(client, **headers):
+        response = await client.get('/note', headers=headers)
+        return [note['text'] for note in await response.json()]
+
+    async def test(client):
+        return await asyncio.gather(
+            get_texts(client, Authorization='alice'),
+            get_texts(client, Authorization='bob'),
+            get_texts(client, Cookie='user=alice'),
+            get_texts(client, Cookie='user=bob'),
+            get_texts(client, Authorization='alice'))
+
+    assert serve(app, test) == [['a'], ['b'], ['a'], ['b'], ['a']]
+    # Only the two requests of the same user shared a response
+    assert single_flight.stats()['coalesced'] == 1
@@ -0,0 +1,121 @@
+import peewee
+import sqlalchemy as sa
+from aiohttp import web
+
+from aiorf import modelschema
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+from benchmarks.standin import connect
+
+from conftest import make_endpoint, make_model, serve
+
+table = sa.Table(
+    'item', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+    sa.Column('version', sa.Integer),
+)
+
+
+def make_app(db_path):
+    conn = connect(db_path)
+    conn.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, name VARCHAR(100), version INTEGER)')
+    conn.executemany('INSERT INTO item (name, version) VALUES (?, ?)', [('a', 5), ('b', 1), ('c', 1)])
+    return make_endpoint(db_path, table, etag_field='version'), conn
+
+
+def make_viewset_app(database, manager):
+    item_model = make_model(database, 'item', name=peewee.CharField())
+    item_model.create(name='a')
+    database.set_allow_sync(False)
+
+    class ItemSchema(modelschema.ModelSchema):
+        class Meta:
+            model = item_model
+
+    class ItemViewSet(ModelViewSet):
+        serializer_class = ItemSchema
+
+    ItemViewSet.manager = manager
+    router = DefaultRouter()
+    router.register('/items', ItemViewSet)
+    app = web.Application()
+    router.setup_routes(app.router)
+    return app, item_model
+
+
+def test_list_etag_changes_with_any_row(db_path):
+    app, conn = make_app(db_path)
+
+    async def test(client):
+        first = await client.get('/item')
+        etag = first.headers['ETag']
+        unchanged = await client.get('/item', headers={'If-None-Match': etag})
+        # Neither the count nor the newest version change
+        conn.execute("UPDATE item SET name = 'bb', version = 2 WHERE id = 2")
+        changed = await client.get('/item', headers={'If-None-Match': etag})
+        return unchanged.status, changed.status, [item['name'] for item in await changed.json()]
+
+    assert serve(app, test) == (304, 200, ['a', 'bb', 'c'])
+
+
+def test_list_not_modified_before_counting(db_path, queries):
+    app, conn = make_app(db_path)
+
+    async def test(client):
+        etag = (await client.get('/item')).headers['ETag']
+        del queries[:]
+        response = await client.get('/item', headers={'If-None-Match': etag})
+        return response.status
+
+    assert serve(app, test) == 304
+    # Only the validators
+    assert len(queries) == 1 and 'md5' in queries[0]
+
+
+def test_if_match_is_a_strong_comparison(db_path):
+    app, conn = make_app(db_path)
+
+    async def test(client):
+        etag = (await client.get('/item/1')).headers['ETag']
+        weak = await client.patch('/item/1', json={'name': 'x'}, headers={'If-Match': 'W/' + etag})
+        strong = await client.patch('/item/1', json={'name': 'y'}, headers={'If-Match': etag})
+        # If-None-Match compares weakly
+        cached = await client.get('/item/1', headers={'If-None-Match': 'W/' + etag})
+        return weak.status, strong.status, cached.status
+
+    assert serve(app, test) == (412, 200, 304)
+    assert conn.execute('SELECT name FROM item WHERE id = 1').fetchone()[0] == 'y'
+
+
+def test_etag_of_a_compressed_response_matches(db_path):
+    app, conn = make_app(db_path)
+    # Long enough to be compressed
+    conn.execute("UPDATE item SET name = ? WHERE id = 1", ['a' * 2000])
+
+    async def test(client):
+        response = await client.get('/item/1', headers={'Accept-Encoding': 'gzip'})
+        etag = response.headers['ETag']
+        cached = await client.get('/item/1', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        patched = await client.patch('/item/1', json={'name': 'x'}, headers={'If-Match': etag})
+        return response.headers['Content-Encoding'], etag.startswith('W/'), cached.status, patched.status
+
+    assert serve(app, test) == ('gzip', False, 304, 200)
+
+
+def test_viewset_if_match_locks_the_row(database, manager, queries):
+    app, model = make_viewset_app(database, manager)
+
+    async def test(client):
+        etag = (await client.get('/items/1')).headers['ETag']
+        del queries[:]
+        patched = await client.patch('/items/1', json={'name': 'x'}, headers={'If-Match': etag})
+        stale = await client.delete('/items/1', headers={'If-Match': etag})
+        return patched.status, stale.status
+
+    assert serve(app, test) == (200, 412)
+    # The check reads the row locked, in the transaction of the write
+    assert [sql.split()[0] + (' FOR UPDATE' if sql.endswith('FOR UPDATE') else '') for sql in queries] == [
+        'BEGIN', 'SELECT FOR UPDATE', 'UPDATE', 'COMMIT',
+        'BEGIN', 'SELECT FOR UPDATE', 'ROLLBACK',
+    ]
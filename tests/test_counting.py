@@ -0,0 +1,36 @@
+import asyncio
+
+import peewee
+
+from aiorf.counting import ExactCount
+
+from conftest import make_model
+
+
+class RecordingManager:
+    """
+    The counting part of a peewee_async manager, recording the queries.
+    """
+    def __init__(self, total):
+        self.total = total
+        self.queries = []
+
+    async def count(self, query):
+        self.queries.append(query)
+        return self.total
+
+
+class View:
+    def __init__(self, manager, read_manager):
+        self.manager = manager
+        self.read_manager = read_manager
+
+
+def test_exact_count_reads_from_the_read_manager(database):
+    model = make_model(database, 'item', name=peewee.CharField())
+    database.set_allow_sync(False)
+    view = View(RecordingManager(3), RecordingManager(1))
+
+    total = asyncio.get_event_loop().run_until_complete(ExactCount().count_queryset(model.select(), view))
+    assert total.value == 1
+    assert view.manager.queries == []
@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+import decimal
+import uuid
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from aiorf import renderers
+from aiorf.backends import AiopgConnection
+from aiorf.streaming import CSV, NDJSON
+
+table = sa.Table(
+    'event', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('created', sa.DateTime),
+    sa.Column('amount', sa.Numeric),
+    sa.Column('token', sa.dialects.postgresql.UUID),
+    sa.Column('active', sa.Boolean),
+)
+
+ROW = {
+    'id': 1,
+    'created': datetime.datetime(2020, 1, 1, 12, 30),
+    'amount': decimal.Decimal('1.50'),
+    'token': uuid.UUID(int=1),
+    'active': True,
+}
+
+# What Postgres writes for ROW through the asyncpg backend: `COPY ... CSV
+# HEADER` and `row_to_json`
+COPY_OUTPUT = {
+    CSV: b'id,created,amount,token,active\n'
+         b'1,2020-01-01 12:30:00,1.50,00000000-0000-0000-0000-000000000001,t\n',
+    NDJSON: b'{"id":1,"created":"2020-01-01T12:30:00","amount":1.50,'
+            b'"token":"00000000-0000-0000-0000-000000000001","active":true}\n',
+}
+
+
+class Backend:
+    dialect = PGDialect_psycopg2()
+
+
+class Transaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchall(self):
+        return self.rows
+
+
+class SAConnection:
+    """
+    The part of an aiopg `SAConnection` that cursors use, serving `rows`
+    to the first `FETCH`.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+    def begin(self):
+        return Transaction()
+
+    async def execute(self, sql, params=None):
+        if not sql.startswith('FETCH'):
+            return Result([])
+        rows, self.rows = self.rows, []
+        return Result(rows)
+
+
+@pytest.mark.parametrize('orjson', [renderers.orjson, None])
+@pytest.mark.parametrize('fmt', [CSV, NDJSON])
+def test_aiopg_export_matches_copy(monkeypatch, orjson, fmt):
+    monkeypatch.setattr(renderers, 'orjson', orjson)
+    conn = AiopgConnection(Backend(), SAConnection([ROW]))
+    chunks = []
+
+    async def output(chunk):
+        chunks.append(chunk)
+    asyncio.get_event_loop().run_until_complete(conn.copy_query(table.select(), output, fmt))
+
+    assert b''.join(chunks) == COPY_OUTPUT[fmt]
@@ -0,0 +1,58 @@
+import peewee
+from aiohttp import web
+
+from aiorf import modelschema
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+
+from conftest import make_model, serve
+
+
+def make_app(database, manager):
+    author_model = make_model(database, 'author', name=peewee.CharField())
+    book_model = make_model(database, 'book', title=peewee.CharField(), isbn=peewee.CharField(),
+                            author=peewee.ForeignKeyField(author_model))
+    author = author_model.create(name='someone')
+    book_model.create(title='a book', isbn='123', author=author)
+    database.set_allow_sync(False)
+
+    class BookSchema(modelschema.ModelSchema):
+        class Meta:
+            model = book_model
+
+    class BookViewSet(ModelViewSet):
+        serializer_class = BookSchema
+
+    BookViewSet.manager = manager
+    router = DefaultRouter()
+    router.register('/books', BookViewSet)
+    app = web.Application()
+    router.setup_routes(app.router)
+    return app, author.id
+
+
+def test_sparse_fieldset_narrows_retrieve(database, manager, queries):
+    app, _ = make_app(database, manager)
+
+    async def test(client):
+        response = await client.get('/books/1?fields=title')
+        return response.status, await response.json()
+
+    assert serve(app, test) == (200, {'title': 'a book'})
+    select = [sql for sql in queries if sql.startswith('SELECT') and '"book"' in sql][-1]
+    assert '"isbn"' not in select
+
+
+def test_sparse_fieldset_with_foreign_key(database, manager, queries):
+    app, author_id = make_app(database, manager)
+
+    async def test(client):
+        retrieved = await client.get('/books/1?fields=title,author')
+        listed = await client.get('/books?fields=author')
+        return (retrieved.status, await retrieved.json()), (listed.status, await listed.json())
+
+    assert serve(app, test) == (
+        (200, {'title': 'a book', 'author': author_id}),
+        (200, [{'author': author_id}]),
+    )
+    assert not [sql for sql in queries if '"author"' in sql.split('FROM')[-1]]
@@ -0,0 +1,53 @@
+import peewee
+import sqlalchemy as sa
+from aiohttp import web
+
+from aiorf import modelschema
+from aiorf.metrics import Metrics
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+from benchmarks.standin import connect
+
+from conftest import make_endpoint, make_model, serve
+
+table = sa.Table('item', sa.MetaData(), sa.Column('id', sa.Integer, primary_key=True))
+
+
+def get_statuses(app, metrics, path):
+    async def test(client):
+        assert (await client.get(path + '/1')).status == 200
+        assert (await client.get(path + '/2')).status == 404
+    serve(app, test)
+    return sorted((endpoint, method, status) for endpoint, method, status, stage in metrics.stages._series
+                  if stage == 'total')
+
+
+def test_endpoint_observes_errors(db_path):
+    conn = connect(db_path)
+    conn.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+    conn.execute('INSERT INTO item (id) VALUES (1)')
+    metrics = Metrics()
+    app = make_endpoint(db_path, table, metrics=metrics)
+    assert get_statuses(app, metrics, '/item') == [('ItemEndpoint', 'GET', 200), ('ItemEndpoint', 'GET', 404)]
+
+
+def test_viewset_observes_errors(database, manager):
+    item_model = make_model(database, 'item', name=peewee.CharField())
+    item_model.create(name='a')
+    database.set_allow_sync(False)
+    metrics = Metrics()
+
+    class ItemSchema(modelschema.ModelSchema):
+        class Meta:
+            model = item_model
+
+    class ItemViewSet(ModelViewSet):
+        serializer_class = ItemSchema
+
+    ItemViewSet.manager = manager
+    ItemViewSet.metrics = metrics
+    router = DefaultRouter()
+    router.register('/items', ItemViewSet)
+    app = web.Application()
+    router.setup_routes(app.router)
+    assert get_statuses(app, metrics, '/items') == [('ItemViewSet', 'GET', 200), ('ItemViewSet', 'GET', 404)]
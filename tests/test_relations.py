@@ -0,0 +1,182 @@
+import peewee
+import sqlalchemy as sa
+from aiohttp import web
+from marshmallow import fields
+
+from aiorf import modelschema, saschema
+from aiorf.filters import QueryFilterBackend
+from aiorf.relations import ForeignKey
+from aiorf.routers import DefaultRouter
+from aiorf.viewsets import ModelViewSet
+from benchmarks.standin import connect
+
+from conftest import make_endpoint, make_model, serve
+
+ROWS = 5
+
+metadata = sa.MetaData()
+country_table = sa.Table(
+    'country', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+)
+author_table = sa.Table(
+    'author', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100)),
+    sa.Column('country_id', sa.Integer, sa.ForeignKey('country.id')),
+)
+book_table = sa.Table(
+    'book', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('title', sa.String(100)),
+    sa.Column('author_id', sa.Integer, sa.ForeignKey('author.id')),
+)
+
+
+def count_queries(app, queries):
+    """
+    Queries run by a list of one book and a list of all of them, checking
+    that every book came with its author and the author's country.
+    """
+    async def test(client):
+        counts = []
+        for query, size in (('?title=book 0', 1), ('', ROWS)):
+            del queries[:]
+            response = await client.get('/book' + query)
+            books = await response.json()
+            assert [book['author']['country']['name'] for book in books] == [
+                'country {}'.format(index) for index in range(size)]
+            counts.append(len(queries))
+        return counts
+    return serve(app, test)
+
+
+def make_endpoint_app(db_path):
+    conn = connect(db_path)
+    conn.execute('CREATE TABLE country (id INTEGER PRIMARY KEY, name VARCHAR(100))')
+    conn.execute('CREATE TABLE author (id INTEGER PRIMARY KEY, name VARCHAR(100), country_id INTEGER)')
+    conn.execute('CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR(100), author_id INTEGER)')
+    for index in range(ROWS):
+        conn.execute('INSERT INTO country (name) VALUES (?)', ['country {}'.format(index)])
+        conn.execute('INSERT INTO author (name, country_id) VALUES (?, ?)', ['author {}'.format(index), index + 1])
+        conn.execute('INSERT INTO book (title, author_id) VALUES (?, ?)', ['book {}'.format(index), index + 1])
+
+    class CountrySchema(saschema.ModelSchema):
+        class Meta:
+            table = country_table
+
+    class AuthorSchema(saschema.ModelSchema):
+        country = ForeignKey(CountrySchema)
+
+        class Meta:
+            table = author_table
+
+    class BookSchema(saschema.ModelSchema):
+        author = ForeignKey(AuthorSchema)
+
+        class Meta:
+            table = book_table
+
+    return make_endpoint(db_path, book_table, schema=BookSchema(), filters=['title'])
+
+
+def make_viewset_app(database, manager):
+    country_model = make_model(database, 'country', name=peewee.CharField())
+    author_model = make_model(database, 'author', name=peewee.CharField(),
+                              country=peewee.ForeignKeyField(country_model))
+    book_model = make_model(database, 'book', title=peewee.CharField(),
+                            author=peewee.ForeignKeyField(author_model))
+    for index in range(ROWS):
+        country = country_model.create(name='country {}'.format(index))
+        author = author_model.create(name='author {}'.format(index), country=country)
+        book_model.create(title='book {}'.format(index), author=author)
+    database.set_allow_sync(False)
+
+    class CountrySchema(modelschema.ModelSchema):
+        class Meta:
+            model = country_model
+
+    class AuthorSchema(modelschema.ModelSchema):
+        country = ForeignKey(CountrySchema)
+
+        class Meta:
+            model = author_model
+
+    class BookSchema(modelschema.ModelSchema):
+        author = ForeignKey(AuthorSchema)
+        # Written in place of the nested author
+        author_id = fields.Integer(load_only=True)
+
+        class Meta:
+            model = book_model
+
+    class BookViewSet(ModelViewSet):
+        serializer_class = BookSchema
+        filter_backends = [QueryFilterBackend]
+        filter_fields = ['title']
+
+    BookViewSet.manager = manager
+    router = DefaultRouter()
+    router.register('/book', BookViewSet)
+    app = web.Application()
+    router.setup_routes(app.router)
+    return app
+
+
+def test_endpoint_queries_per_relation(db_path, queries):
+    counts = count_queries(make_endpoint_app(db_path), queries)
+    # The count, the books, their authors and the authors' countries
+    assert counts == [4, 4]
+
+
+def test_viewset_queries_per_relation(database, manager, queries):
+    counts = count_queries(make_viewset_app(database, manager), queries)
+    # The books, their authors and the authors' countries
+    assert counts == [3, 3]
+
+
+def test_endpoint_if_match_with_relations(db_path):
+    app = make_endpoint_app(db_path)
+
+    async def test(client):
+        etag = (await client.get('/book/1')).headers['ETag']
+        patched = await client.patch('/book/1', json={'title': 'x'}, headers={'If-Match': etag})
+        return patched.status
+
+    assert serve(app, test) == 200
+
+
+def get_author_names(app, requests):
+    """
+    Names of the authors nested in the responses to `(method, path, body)` requests.
+    """
+    async def test(client):
+        names = []
+        for method, path, body in requests:
+            response = await client.request(method, path, json=body)
+            assert response.status < 300, await response.text()
+            data = await response.json()
+            names.extend(item['author']['name'] for item in (data if isinstance(data, list) else [data]))
+        return names
+    return serve(app, test)
+
+
+def test_endpoint_writes_dump_relations(db_path):
+    app = make_endpoint_app(db_path)
+    names = get_author_names(app, [
+        ('POST', '/book', {'title': 'new', 'author_id': 2}),
+        ('POST', '/book', [{'title': 'one', 'author_id': 1}, {'title': 'two', 'author_id': 3}]),
+        ('PATCH', '/book/1', {'author_id': 4}),
+    ])
+    assert names == ['author 1', 'author 0', 'author 2', 'author 3']
+
+
+def test_viewset_writes_dump_relations(database, manager):
+    app = make_viewset_app(database, manager)
+    names = get_author_names(app, [
+        ('POST', '/book', {'title': 'new', 'author_id': 2}),
+        ('POST', '/book', [{'title': 'one', 'author_id': 1}, {'title': 'two', 'author_id': 3}]),
+        ('PATCH', '/book/1', {'author_id': 4}),
+    ])
+    assert names == ['author 1', 'author 0', 'author 2', 'author 3']
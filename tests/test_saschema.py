@@ -0,0 +1,23 @@
+import pytest
+import sqlalchemy as sa
+from marshmallow import ValidationError
+
+from aiorf import saschema
+
+table = sa.Table(
+    'tag', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(5)),
+)
+
+
+class TagSchema(saschema.ModelSchema):
+    class Meta:
+        table = table
+
+
+def test_string_length_is_validated():
+    assert TagSchema().validate({'name': 'short'}) == {}
+    with pytest.raises(ValidationError) as info:
+        TagSchema().load({'name': 'too long'})
+    assert list(info.value.messages) == ['name']
@@ -0,0 +1,42 @@
+import asyncio
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+
+from aiorf.backends import AiopgConnection
+from aiorf.statements import Statement
+
+table = sa.Table('item', sa.MetaData(), sa.Column('id', sa.Integer, primary_key=True))
+
+
+class RawConnection:
+    pass
+
+
+class SAConnection:
+    """
+    The part of an aiopg `SAConnection` that statements use, recording SQL.
+    """
+    def __init__(self):
+        self.connection = RawConnection()
+        self.executed = []
+
+    async def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+
+def test_statements_of_the_same_sql_share_the_prepared_one():
+    dialect = PGDialect_psycopg2()
+    query = table.select().where(table.c.id == sa.bindparam('lookup'))
+    first, second = Statement(query, dialect, prepare=True), Statement(query, dialect, prepare=True)
+    sa_conn = SAConnection()
+    conn = AiopgConnection(None, sa_conn)
+
+    async def run():
+        for statement in (first, second, first):
+            await conn._execute_statement(statement, {'lookup': 1})
+    asyncio.get_event_loop().run_until_complete(run())
+
+    prepares = [sql for sql in sa_conn.executed if sql.startswith('PREPARE')]
+    assert prepares == ['PREPARE {} AS {}'.format(first.name, first.numbered_sql)]
+    assert sum(sql.startswith('EXECUTE') for sql in sa_conn.executed) == 3